@@ -0,0 +1,167 @@
+# File: browser_watchdog
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Browser resource watchdog.
+# A thread samples memory and CPU of each geckodriver and its Firefox
+# processes (needs psutil). WebDriver latency is probed from the main
+# thread between patients, so no command runs concurrently with the desk.
+# A limit must be passed on `sustain` samples in a row to recycle, so page
+# load spikes do not. CPU is a share of the whole machine.
+# -----------------------
+import time
+import logging
+import threading
+
+from selenium.common.exceptions import WebDriverException
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+timing_log = logging.getLogger("timing")
+
+
+class BrowserWatchdog(threading.Thread):
+    """Watch browser sessions resources."""
+
+    def __init__(
+        self,
+        drivers,
+        interval=10,
+        max_memory=1500,
+        max_cpu=90,
+        max_latency=2.0,
+        sustain=3,
+    ):
+        """Initialize watchdog.
+
+        `drivers` is the dict of drivers to watch, it may change.
+        `max_memory` is in MB, `max_cpu` in percent, `max_latency` in
+        seconds. `sustain` is the number of samples in a row over a limit
+        before recycling.
+        """
+        super(BrowserWatchdog, self).__init__(name="watchdog", daemon=True)
+        self.drivers = drivers
+        self.interval = interval
+        self.max_memory = max_memory
+        self.max_cpu = max_cpu
+        self.max_latency = max_latency
+        self.sustain = sustain
+
+        self.samples = {}
+        self._processes = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        if psutil is None:
+            logging.warning("psutil not installed, only watching latency")
+
+    def _processes_of(self, driver):
+        """Get geckodriver and its Firefox processes."""
+        pid = driver.service.process.pid
+        if pid not in self._processes:
+            self._processes[pid] = psutil.Process(pid)
+        processes = [self._processes[pid]]
+        for child in processes[0].children(recursive=True):
+            # Keep Process objects, cpu_percent compares to the last call.
+            processes.append(self._processes.setdefault(child.pid, child))
+        return processes
+
+    @staticmethod
+    def _count(sample, key, over):
+        """Count the samples in a row over a limit."""
+        sample[key + "_over"] = sample.get(key + "_over", 0) + 1 if over else 0
+
+    def sample(self, name):
+        """Sample memory (MB) and CPU (%) of browser `name`."""
+        if psutil is None:
+            return
+        memory = cpu = 0
+        try:
+            for process in self._processes_of(self.drivers[name]):
+                with process.oneshot():
+                    memory += process.memory_info().rss
+                    cpu += process.cpu_percent(None)
+        except (psutil.Error, AttributeError, KeyError):
+            # Browser is being recycled or gone.
+            return
+        with self._lock:
+            sample = self.samples.setdefault(name, {})
+            sample["memory"] = memory / 2**20
+            sample["cpu"] = cpu / (psutil.cpu_count() or 1)
+            self._count(sample, "memory", sample["memory"] > self.max_memory)
+            self._count(sample, "cpu", sample["cpu"] > self.max_cpu)
+
+    def run(self):
+        """Sample all browsers until stopped."""
+        while not self._stop_event.wait(self.interval):
+            for name in list(self.drivers):
+                self.sample(name)
+            # Forget processes that are gone.
+            for pid in [
+                p for p in self._processes if not psutil.pid_exists(p)
+            ]:
+                del self._processes[pid]
+
+    def start(self):
+        """Start sampling, if psutil is available."""
+        if psutil is not None:
+            super(BrowserWatchdog, self).start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop_event.set()
+
+    def probe(self, name):
+        """Measure WebDriver latency of browser `name`. Main thread only."""
+        start = time.perf_counter()
+        try:
+            self.drivers[name].title
+        except WebDriverException:
+            latency = None
+        else:
+            latency = time.perf_counter() - start
+
+        with self._lock:
+            sample = self.samples.setdefault(name, {})
+            sample["latency"] = latency
+            self._count(
+                sample,
+                "latency",
+                latency is not None and latency > self.max_latency,
+            )
+            timing_log.info(
+                "Browser %s: memory %.0fMB, cpu %.0f%%, latency %s",
+                name,
+                sample.get("memory", 0),
+                sample.get("cpu", 0),
+                "dead" if latency is None else "%.3fs" % latency,
+            )
+        return latency
+
+    def check(self, name):
+        """Probe browser `name`, return why to recycle it or None."""
+        latency = self.probe(name)
+        with self._lock:
+            sample = dict(self.samples[name])
+
+        if latency is None:
+            return "not responding"
+        if sample.get("latency_over", 0) >= self.sustain:
+            return "latency %.3fs" % latency
+        if sample.get("memory_over", 0) >= self.sustain:
+            return "memory %.0fMB" % sample["memory"]
+        if sample.get("cpu_over", 0) >= self.sustain:
+            return "cpu %.0f%%" % sample["cpu"]
+        return None
+
+    def forget(self, name):
+        """Forget the samples of a recycled browser."""
+        with self._lock:
+            self.samples.pop(name, None)
@@ -0,0 +1,167 @@
+# File: cassette
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Record and replay HTTP traffic, for deterministic tests and benchmarks
+# and as an offline fallback.
+# Requests are keyed by their canonical form (method, sorted query, body,
+# accept header) in `requests/`. Response bodies are stored gzipped and
+# content-addressed in `blobs/`, so identical pages are stored once.
+# Modes:
+#   off            - Plain HTTP.
+#   record         - Always go to the network and store responses.
+#   replay         - Only serve stored responses, never the network.
+#   record_missing - Serve stored responses, record the missing ones.
+# Error (4xx, 5xx) responses are never stored, they would be replayed for
+# ever.
+# -----------------------
+import os
+import gzip
+import json
+import hashlib
+import logging
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+MODES = ("off", "record", "replay", "record_missing")
+
+# Headers that change the response, part of the request key.
+KEY_HEADERS = ("accept",)
+# Headers that do not apply to the stored, decoded body.
+DROP_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+
+
+class CassetteMiss(requests.ConnectionError):
+    """Error when replaying a request that was never recorded."""
+
+
+def request_key(request):
+    """Get the key of a prepared request."""
+    scheme, netloc, path, query, _ = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    url = urlunsplit((scheme.lower(), netloc.lower(), path, query, ""))
+
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    canonical = [
+        request.method.upper(),
+        url,
+        hashlib.sha256(body).hexdigest(),
+        [request.headers.get(header, "") for header in KEY_HEADERS],
+    ]
+    return hashlib.sha256(json.dumps(canonical).encode("utf-8")).hexdigest()
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter recording and replaying responses."""
+
+    def __init__(self, directory, mode="record_missing", **kwargs):
+        """Initialize adapter storing in `directory`."""
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {MODES}.")
+        super(CassetteAdapter, self).__init__(**kwargs)
+        self.mode = mode
+        self.directory = directory
+        for sub_directory in ("requests", "blobs"):
+            path = os.path.join(directory, sub_directory)
+            if not os.path.exists(path):
+                os.makedirs(path)
+
+    def _path(self, key):
+        """Get the request file path of `key`."""
+        return os.path.join(self.directory, "requests", key + ".json")
+
+    def _blob_path(self, digest):
+        """Get the blob file path of `digest`."""
+        return os.path.join(self.directory, "blobs", digest + ".gz")
+
+    def send(self, request, **kwargs):
+        """Send a request, or replay it."""
+        key = request_key(request)
+        path = self._path(key)
+
+        if self.mode in ("replay", "record_missing") and os.path.exists(path):
+            logging.info("Cassette replay: %s", request.url)
+            return self._load(request, path)
+        if self.mode == "replay":
+            raise CassetteMiss(f"Not recorded: {request.url}", request=request)
+
+        response = super(CassetteAdapter, self).send(request, **kwargs)
+        if self.mode != "off" and response.ok:
+            logging.info("Cassette record: %s", request.url)
+            self._save(response, path)
+        return response
+
+    def _save(self, response, path):
+        """Store a response."""
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            with gzip.open(blob_path + ".tmp", "wb") as file:
+                file.write(body)
+            os.replace(blob_path + ".tmp", blob_path)
+
+        entry = {
+            "url": response.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                k: v
+                for k, v in response.headers.items()
+                if k.lower() not in DROP_HEADERS
+            },
+            "body": digest,
+        }
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(entry, file)
+        os.replace(path + ".tmp", path)
+
+    def _load(self, request, path):
+        """Build a response from storage."""
+        with open(path, "r", encoding="utf-8") as file:
+            entry = json.load(file)
+        with gzip.open(self._blob_path(entry["body"]), "rb") as file:
+            body = file.read()
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = entry["url"]
+        response.request = request
+        response.connection = self
+        response._content = body
+        return response
+
+
+def session(directory=None, mode=None):
+    """Get a requests session going through a cassette.
+
+    Mode and directory default to the COVRECORD_CASSETTE and
+    COVRECORD_CASSETTE_DIR environment variables.
+    """
+    mode = mode or os.environ.get("COVRECORD_CASSETTE", "off")
+    directory = directory or os.environ.get(
+        "COVRECORD_CASSETTE_DIR", "cassettes"
+    )
+
+    http_session = requests.Session()
+    if mode != "off":
+        logging.info("Cassette %s in %s", mode, directory)
+        adapter = CassetteAdapter(directory, mode)
+        http_session.mount("http://", adapter)
+        http_session.mount("https://", adapter)
+    return http_session
@@ -15,6 +15,9 @@ import logging
 import shutil
 import datetime
 import json
+import argparse
+import platform
+import subprocess
 from xml.etree import ElementTree as ET
 
 import pyperclip
@@ -27,15 +30,22 @@ from selenium.common.exceptions import ElementNotInteractableException
 from selenium.common.exceptions import ElementClickInterceptedException
 from selenium.common.exceptions import WebDriverException
 
-
-class EmptySearchWarning(Warning):
-    """Warning when generating an empty search."""
-
-    def __init__(self):
-        """Initialize warning class."""
-        super(EmptySearchWarning, self).__init__(
-            "Warning! You are generating an empty search url!"
-        )
+from inami import InamiSearchClient, decompose_doctor_name
+from covrecord_http import CovRecordClient, CovRecordError
+from covrecord_http import CovRecordUnconfirmed
+from journal import PatientJournal
+from sessions import CookieStore, has_element, IMPLICIT_WAIT
+from profiling import PatientProfiler
+from duplicates import DailyIndex
+from validation import validate, NON_DIGITS
+from locators import LocatorRegistry
+from browser_watchdog import BrowserWatchdog
+import cassette
+from ledger import Ledger
+from scanner import InputQueue, next_tube
+from prefetch import PATIENT_TTL, WaitingRoomPrefetcher
+from mediris import MedirisClient, MedirisError
+from supervisor import connect as connect_supervisor
 
 
 def maximize(driver):
@@ -56,9 +66,116 @@ def minimize(driver):
         logging.warning("Could not minimize")
 
 
+# Command line arguments.
+parser = argparse.ArgumentParser(description="Register patients in CovRecord.")
+parser.add_argument(
+    "command",
+    nargs="?",
+    default="run",
+    choices=("run", "stats", "update"),
+    help="`run` the desk (default), print registration `stats` or only"
+    " `update`.",
+)
+parser.add_argument(
+    "--days",
+    type=int,
+    default=1,
+    help="With `stats`, number of days to report on.",
+)
+parser.add_argument(
+    "--desk",
+    default=platform.node(),
+    help="Desk name in the registration ledger.",
+)
+parser.add_argument(
+    "--direct-submit",
+    action="store_true",
+    help="Submit registrations over HTTP, only use the browser to print.",
+)
+parser.add_argument(
+    "--profile",
+    nargs="?",
+    const="cprofile",
+    choices=("cprofile", "pyinstrument"),
+    help="Profile each patient, written to the profiles directory.",
+)
+parser.add_argument(
+    "--profile-sections",
+    action="store_true",
+    help="With --profile, also write a profile for each section.",
+)
+parser.add_argument(
+    "--index-dir",
+    help="Directory of the duplicate registration index, can be shared.",
+)
+parser.add_argument(
+    "--max-browser-memory",
+    type=float,
+    default=1500,
+    help="Recycle a browser using more memory (MB) than this.",
+)
+parser.add_argument(
+    "--max-browser-cpu",
+    type=float,
+    default=90,
+    help="Recycle a browser using more of the machine's CPU (%%) than this.",
+)
+parser.add_argument(
+    "--max-browser-latency",
+    type=float,
+    default=2.0,
+    help="Recycle a browser answering slower (seconds) than this.",
+)
+parser.add_argument(
+    "--cassette",
+    choices=cassette.MODES,
+    help="Record or replay SilverPages and GitHub HTTP traffic.",
+)
+parser.add_argument(
+    "--prefetch",
+    action="store_true",
+    help="Prefetch waiting patients' Mediris data in the background.",
+)
+parser.add_argument(
+    "--mediris-api",
+    action="store_true",
+    help="Get Mediris patient data over its JSON API, not the page.",
+)
+parser.add_argument(
+    "--eid-dir",
+    default=os.path.join(os.path.expandvars("%TMP%"), "eid"),
+    help="Directory the eID file is exported to, one per desk.",
+)
+parser.add_argument(
+    "--supervisor",
+    help="Supervisor address (host:port) when run as one of its desks.",
+)
+args = parser.parse_args()
+
+# Registration ledger
+LEDGER_PATH = os.path.join(os.path.dirname(__file__), "covrecord.ledger")
+if args.command == "stats":
+    # Print stats without setting up the desk.
+    Ledger(LEDGER_PATH).print_stats(args.days)
+    raise SystemExit()
+
+# Desks run by the supervisor each keep their own log and journal.
+# Same for locator statistics and browser sessions, which are rewritten
+# all the time.
+if args.supervisor:
+    LOG_PATH = f"{__file__}.{args.desk}.log"
+    JOURNAL_NAME = f"covrecord.{args.desk}.journal"
+    LOCATOR_STATS_NAME = f"locator_stats.{args.desk}.json"
+    SESSIONS_NAME = os.path.join("sessions", args.desk)
+else:
+    LOG_PATH = f"{__file__}.log"
+    JOURNAL_NAME = "covrecord.journal"
+    LOCATOR_STATS_NAME = "locator_stats.json"
+    SESSIONS_NAME = "sessions"
+
 # Setup the log file configutation.
 logging.basicConfig(
-    filename=__file__ + ".log",
+    filename=LOG_PATH,
     level=logging.INFO,
     format="At %(asctime)s: %(name)s - %(levelname)s: %(message)s",
     filemode="w",
@@ -76,30 +193,19 @@ GECKO_DRIVER = r"geckodriver.exe"
 logging.info("Gecko driver located at: %s", GECKO_DRIVER)
 logging.info("Using Firefox driver")
 
-# CovRecord Form fields and buttons
-FIELDS = {
-    "name": '//*[@id="nom"]',
-    "firstname": '//*[@id="prenom"]',
-    "nationalnumber": '//*[@id="NISS"]',
-    "dateofbirth": '//*[@id="ddn"]',
-    "phone": '//*[@id="telephone"]',
-    "email": '//*[@id="email"]',
-    "test_tube": '//*[@id="numberEcouvillon"]',
-    "doctor": '//*[@id="nomMedecin"]',
-    "inami": '//*[@id="inamiMedecin"]',
-    "gender": '//*[@id="sex"]',
-    "zip": '//*[@id="adresse"]',
-}
-BUTTONS = {
-    "print": "button.btn-primary:nth-child(1)",
-    "save": "button.btn:nth-child(2)",
-}
+# HTTP session, through the record/replay cassette if asked for.
+http_session = cassette.session(mode=args.cassette)
 
-# INAMI Search data
-INAMI_BASE_URL = (
-    r"https://ondpanon.riziv.fgov.be/SilverPages/fr/Home/"
-    r"SearchByForm?PageOffset=0&PageSize=200"
-)
+# INAMI Search data. Desks of a supervisor share its client and tubes.
+tube_allocator = None
+if args.supervisor:
+    logging.info("Desk %s of supervisor %s", args.desk, args.supervisor)
+    supervisor = connect_supervisor(args.supervisor)
+    inami_client = supervisor.inami()
+    tube_allocator = supervisor.tubes()
+else:
+    # Keeps prefetched GP searches as long as their patients.
+    inami_client = InamiSearchClient(ttl=PATIENT_TTL, session=http_session)
 inami_search_data = {
     "lastname": "",
     "firstname": "",
@@ -112,6 +218,16 @@ inami_search_data = {
 WORK_DIR = os.path.dirname(__file__)
 logging.info("Work directory: %s", WORK_DIR)
 
+# Page element locators, with CovRecord form fields.
+locators = LocatorRegistry(
+    os.path.join(WORK_DIR, "locators.json"),
+    os.path.join(WORK_DIR, LOCATOR_STATS_NAME),
+)
+FIELDS = locators.group("covrecord.field")
+# Form field ids and save button, for direct registration.
+FIELD_IDS = locators.group("covrecord.field", "id")
+SAVE_BUTTON = locators.group("covrecord.button", "css")["save"]
+
 # Create Error logs file.
 if not os.path.exists(f"{WORK_DIR}\\errors"):
     os.mkdir(f"{WORK_DIR}\\errors")
@@ -121,6 +237,75 @@ logging.info("Getting authentication")
 with open("covrecord.auth", "r", encoding="utf-8") as auth_file:
     AUTH = json.load(auth_file)
 
+# ---------- START Auto-update ----------
+# The supervisor updates once for all its desks.
+if not args.supervisor:
+    GITHUB_URL = (
+        "https://api.github.com/repos/TheoTechnicguy/"
+        "Etterbeek-Testing/releases"
+    )
+
+    # Github needs a custom header.
+    # Authentication is made via a token from github.
+    # For security, it is stored as an local_user environment variable.
+    header = {
+        "Authenication": "token " + AUTH["github_token"],
+        "accept": "application/vnd.github.v3+json",
+    }
+
+    logging.info("Getting github repos")
+
+    # Get github repos w/ requests "GET" method.
+    try:
+        github_page = http_session.get(GITHUB_URL, headers=header)
+    except requests.RequestException as e:
+        # Offline, or not recorded when replaying.
+        logging.warning("GitHub unavailable: %s", e)
+        github_page = None
+
+    # Check if all is ok (status_code 200)
+    if github_page is None or github_page.status_code != 200:
+        # Notify of fail and write page contents into the log file.
+        print(f"Could not autoupdate. You are running version {__version__}.")
+        logging.critical("Something went wrong...")
+        if github_page is not None:
+            logging.info(github_page.status_code)
+            logging.info(github_page.text)
+    else:
+        # loop (once) throug releases json.
+        # The `for` loop is to deal with no releases.
+        for release in json.loads(github_page.text):
+            if release["tag_name"] > __version__:
+                logging.info("Attepting update")
+                # Loop throug the assets in the release.
+                for asset in release["assets"]:
+                    logging.info("Getting file: %s", asset["name"])
+                    # Only get the release if does not exist.
+                    if not os.path.exists(
+                        os.path.join(WORK_DIR, asset["name"])
+                    ):
+                        try:
+                            content = http_session.get(
+                                asset["browser_download_url"]
+                            ).content
+                        except requests.RequestException as e:
+                            logging.warning("Could not get file: %s", e)
+                            continue
+                        with open(asset["name"], "wb+") as file:
+                            file.write(content)
+                    else:
+                        logging.info("File already exists.")
+            else:
+                logging.info("Already up to date.")
+
+            # Only check 1st release because they are (or should be)
+            # incremental.
+            break
+# ---------- END Auto-update ---------
+
+if args.command == "update":
+    raise SystemExit()
+
 
 # Set AutoHotkey script path.
 if os.path.exists(os.path.join(WORK_DIR, "eid_viewer_export.exe")):
@@ -131,335 +316,555 @@ else:
     raise ImportError("Missing eid_viewer_export AHK script!")
 
 # Set path for eid file
-EID_DIR = os.path.join(os.path.expandvars("%TMP%"), "eid")
+EID_DIR = args.eid_dir
 EID_PATH = os.path.join(EID_DIR, "patient.eid")
 
 # Create temp path if it does not exist.
 if not os.path.exists(EID_DIR):
-    os.mkdir(EID_DIR)
+    os.makedirs(EID_DIR)
 else:
-    # Clean directory by deleting everything.
+    # Clean directory by deleting every file.
     contents = os.listdir(EID_DIR)
     if contents:
         for file in contents:
-            os.remove(os.path.join(EID_DIR, file))
+            if os.path.isfile(os.path.join(EID_DIR, file)):
+                os.remove(os.path.join(EID_DIR, file))
 
-# Setup Firefox drivers
-logging.info("Setting up drivers")
-drivers = {
-    "covrecord": webdriver.Firefox(executable_path=GECKO_DRIVER),
-    "mediris": webdriver.Firefox(executable_path=GECKO_DRIVER),
+# Site pages
+URLS = {
+    "covrecord": "http://croixrougewsl.be/covrecord/index.php",
+    "mediris": "https://bxltestest.mediris.be/Wachtzaal",
 }
+LOGIN_FIELD = locators.value("login.username")
 
-# For each driver, minimize window and implicitly wait 3 seconds.
-for name, driver in drivers.items():
+# Browser sessions are kept between runs.
+cookie_store = CookieStore(os.path.join(WORK_DIR, SESSIONS_NAME))
+
+
+def login_covrecord(driver):
+    """Open CovRecord, reusing the saved session if still valid."""
+    restored = cookie_store.restore("covrecord", driver, URLS["covrecord"])
+    if restored and not has_element(driver, LOGIN_FIELD):
+        logging.info("Reusing CovRecord session")
+        return
+
+    # Let User login to CovRecord by maximizing the window.
+    logging.info("No valid CovRecord session")
+    if not restored:
+        driver.get(URLS["covrecord"])
+    maximize(driver)
+    while True:
+        try:
+            driver.find_element_by_xpath(LOGIN_FIELD)
+        except NoSuchElementException:
+            logging.info("Logged in to CovRecord")
+            break
+        else:
+            time.sleep(1)
     minimize(driver)
-    driver.implicitly_wait(3)
-logging.info("Drivers setup")
+    cookie_store.save("covrecord", driver)
+
+
+def login_mediris(driver):
+    """Open Mediris, reusing the saved session if still valid."""
+    logging.info("Getting Mediris")
+    restored = cookie_store.restore("mediris", driver, URLS["mediris"])
+    if restored and not has_element(driver, LOGIN_FIELD):
+        logging.info("Reusing Mediris session")
+        return
+
+    # Login to Mediris page
+    logging.info("No valid Mediris session")
+    if not restored:
+        driver.get(URLS["mediris"])
+    locators.find(driver, "login.username").send_keys(AUTH["mediris"]["user"])
+    locators.find(driver, "login.password").send_keys(
+        AUTH["mediris"]["password"], Keys.RETURN
+    )
+
+    # Wait for the login to go through before saving.
+    while has_element(driver, LOGIN_FIELD):
+        time.sleep(1)
+    logging.info("Logged in to Mediris")
+    cookie_store.save("mediris", driver)
 
-# Open CovRecord page on covrecord driver.
-drivers["covrecord"].get("http://croixrougewsl.be/covrecord/index.php")
 
-# Let User login to CovRecord by maximizing the window.
-maximize(drivers["covrecord"])
-while True:
+LOGINS = {
+    "covrecord": login_covrecord,
+    "mediris": login_mediris,
+}
+
+
+def start_driver():
+    """Start a Firefox driver."""
+    driver = webdriver.Firefox(executable_path=GECKO_DRIVER)
+    # Minimize window and implicitly wait.
+    minimize(driver)
+    driver.implicitly_wait(IMPLICIT_WAIT)
+    return driver
+
+
+def recycle(name):
+    """Restart browser `name`, restoring login and the open page."""
+    logging.info("Recycling %s browser", name)
+    driver = drivers[name]
     try:
-        drivers["covrecord"].find_element_by_xpath('//*[@id="username"]')
-    except NoSuchElementException:
-        logging.info("Logged in to CovRecord")
-        break
-    else:
-        time.sleep(1)
-minimize(drivers["covrecord"])
+        url = driver.current_url
+        cookie_store.save(name, driver)
+    except WebDriverException:
+        # Browser crashed, start over from the site's page.
+        url = URLS[name]
+    try:
+        driver.quit()
+    except WebDriverException:
+        pass
 
-# Open Mediris page
-logging.info("Getting Mediris")
-drivers["mediris"].get("https://bxltestest.mediris.be/Wachtzaal")
+    drivers[name] = start_driver()
+    watchdog.forget(name)
+    LOGINS[name](drivers[name])
+    if url != URLS[name]:
+        drivers[name].get(url)
 
-# Login to Mediris page
-drivers["mediris"].find_element_by_xpath('//*[@id="username"]').send_keys(
-    AUTH["mediris"]["user"]
-)
-drivers["mediris"].find_element_by_xpath('//*[@id="password"]').send_keys(
-    AUTH["mediris"]["password"], Keys.RETURN
-)
 
-# Test tube prediction variable.
-test_tube_predict = ""
-# ---------- END Setup ----------
+# Setup Firefox drivers
+logging.info("Setting up drivers")
+drivers = {
+    "covrecord": start_driver(),
+    "mediris": start_driver(),
+}
+logging.info("Drivers setup")
 
-# ---------- START Auto-update ----------
-GITHUB_URL = (
-    "https://api.github.com/repos/TheoTechnicguy/" "Etterbeek-Testing/releases"
+# Open CovRecord and Mediris pages, login only if needed.
+for name, driver in drivers.items():
+    LOGINS[name](driver)
+
+# Watch browsers memory, CPU and latency.
+watchdog = BrowserWatchdog(
+    drivers,
+    max_memory=args.max_browser_memory,
+    max_cpu=args.max_browser_cpu,
+    max_latency=args.max_browser_latency,
 )
+watchdog.start()
 
-# Github needs a custom header.
-# Authentication is made via a token from github.
-# For security, it is stored as an local_user environment variable.
-header = {
-    "Authenication": "token " + AUTH["github_token"],
-    "accept": "application/vnd.github.v3+json",
-}
+# Mediris JSON API client, on the browser's session.
+mediris_client = None
+if args.mediris_api:
+    logging.info("Using Mediris JSON API")
+    mediris_client = MedirisClient(os.path.join(WORK_DIR, "mediris_api.json"))
+    mediris_client.load_cookies(drivers["mediris"].get_cookies())
 
-logging.info("Getting github repos")
 
-# Get github repos w/ requests "GET" method.
-github_page = requests.get(GITHUB_URL, headers=header)
+def fetch_mediris(national_number):
+    """Get a patient's Mediris data over the API, None if it fails."""
+    for attempt in range(2):
+        try:
+            return mediris_client.patient(national_number)
+        except MedirisError as e:
+            logging.warning("Mediris API: %s", e)
+            if attempt:
+                return None
+            # Browser may have a newer session (e.g. recycled).
+            mediris_client.load_cookies(drivers["mediris"].get_cookies())
+        except requests.RequestException as e:
+            logging.warning("Mediris API: %s", e)
+            return None
+
+
+def check_mediris_patient(national_number):
+    """Wait until the patient open in Mediris has `national_number`."""
+    driver = drivers["mediris"]
+    while True:
+        try:
+            locators.click(driver, "mediris.patient_tab")
+            opened = locators.find(
+                driver, "mediris.national_number"
+            ).get_attribute("value")
+        except (NoSuchElementException, ElementClickInterceptedException):
+            opened = ""
+        if NON_DIGITS.sub("", opened or "") == NON_DIGITS.sub(
+            "", str(national_number)
+        ):
+            return
+
+        logging.warning("Other patient open in Mediris")
+        maximize(driver)
+        scanner.prompt("Select the patient in Mediris, then press Enter")
+        minimize(driver)
+
+
+# Prefetch waiting patients' Mediris data, in another browser without API.
+prefetcher = None
+if args.prefetch:
+    prefetcher = WaitingRoomPrefetcher(
+        start_driver,
+        drivers["mediris"].get_cookies(),
+        URLS["mediris"],
+        locators,
+        inami_client,
+        client=mediris_client,
+    )
+    prefetcher.start()
+
+# Setup direct CovRecord submission.
+covrecord_client = None
+if args.direct_submit:
+    logging.info("Using direct CovRecord submission")
+    covrecord_client = CovRecordClient(URLS["covrecord"])
+    if "covrecord" in AUTH:
+        covrecord_client.login(
+            AUTH["covrecord"]["user"], AUTH["covrecord"]["password"]
+        )
+    else:
+        # Borrow the browser's login.
+        covrecord_client.load_cookies(drivers["covrecord"].get_cookies())
 
-# Check if all is ok (status_code 200)
-if github_page.status_code != 200:
-    # Notify of fail and write page contents into the log file.
-    print(f"Could not autoupdate. You are running version {__version__}.")
-    logging.critical("Something went wrong...")
-    logging.info(github_page.status_code)
-    logging.info(github_page.text)
-else:
-    # loop (once) throug releases json.
-    # The `for` loop is to deal with no releases.
-    for release in json.loads(github_page.text):
-        if release["tag_name"] > __version__:
-            logging.info("Attepting update")
-            # Loop throug the assets in the release.
-            for asset in release["assets"]:
-                logging.info("Getting file: %s", asset["name"])
-                # Only get the release if does not exist.
-                if not os.path.exists(os.path.join(WORK_DIR, asset["name"])):
-                    with open(asset["name"], "wb+") as file:
-                        file.write(
-                            requests.get(asset["browser_download_url"]).content
-                        )
-                else:
-                    logging.info("File already exists.")
-        else:
-            logging.info("Already up to date.")
+# Open patient journal. Holds any patient we crashed on.
+journal = PatientJournal(os.path.join(WORK_DIR, JOURNAL_NAME))
 
-        # Only check 1st release because they are (or should be) incremental.
-        break
-# ---------- END Auto-update ---------
+# Index of today's registrations, to catch duplicates. Hashed with the
+# ledger key.
+daily_index = DailyIndex(
+    args.index_dir or os.path.join(WORK_DIR, "index"), AUTH.get("ledger_key")
+)
+
+# Completed registrations ledger. National numbers are only kept hashed,
+# and only if a key is set.
+ledger = Ledger(LEDGER_PATH, AUTH.get("ledger_key"))
+
+# Operator input, read ahead so scans are never lost.
+scanner = InputQueue()
+scanner.start()
+
+# Time and profile patients.
+profiler = PatientProfiler(
+    os.path.join(
+        WORK_DIR,
+        "profiles",
+        datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S_") + args.desk,
+    ),
+    args.profile,
+    args.profile_sections,
+)
+
+# Test tube prediction variable.
+test_tube_predict = journal.state.get("test_tube_predict", "")
+# ---------- END Setup ----------
 
 try:
     while True:
+        # Recycle browsers that crashed or grew too big or slow.
+        for name in list(drivers):
+            reason = watchdog.check(name)
+            if reason is not None:
+                logging.warning("Browser %s: %s", name, reason)
+                recycle(name)
+
         # ---------- START eID Fetching -----------
         logging.info("---------- Next Patient ----------")
         print("\n\n---------- Next patient ----------")
-        # Wait for card to be read.
-        card = input("Read card")
-        # Exit if asked to quit.
-        if card.lower() in ("q", "quit", "e", "exit"):
-            raise SystemExit()
-
-        # Export file via executing AHK script
-        logging.info("Executing AHK Script at %s", AHK_PATH)
-        os.system(AHK_PATH)
-        time.sleep(1)
-
-        # Wait for the file to exist.
-        while not os.path.exists(EID_PATH):
-            logging.info("eID path still not existing")
+        profiler.start_patient()
+        profiler.section("eid")
+        # Resume the patient we crashed on, if any and the operator wants.
+        resumed = journal.resumable() or {}
+        if "eid" in resumed:
+            print(
+                "Unfinished patient",
+                resumed["eid"]["firstname"],
+                resumed["eid"]["name"],
+            )
+            check_in = scanner.prompt("Resume? [yes/no] ")
+            if not check_in.lower().startswith("y"):
+                logging.warning("Discarding unfinished patient")
+                journal.discard()
+                resumed = {}
+        if "eid" in resumed:
+            full_id = dict(resumed["eid"])
+            logging.info("Resuming patient after %s", list(resumed))
+            print("Resuming", full_id["firstname"], full_id["name"])
+        else:
+            # Wait for card to be read.
+            card = scanner.next_event("Read card")
+            # Exit if asked to quit.
+            if card.kind == "command":
+                raise SystemExit()
+
+            # Export file via executing AHK script
+            logging.info("Executing AHK Script at %s", AHK_PATH)
+            # Tell the script where to save, through the shell as .ahk
+            # files are not executables.
+            subprocess.call([AHK_PATH, EID_PATH], shell=True)
             time.sleep(1)
 
-        # Parse eID file to XML and get it's root.
-        logging.info("eID XML at %s %s", EID_PATH, os.path.exists(EID_PATH))
-        xml_file = ET.parse(EID_PATH)
-        xml_root = xml_file.getroot()
-
-        # Start full_id dictionnary with identity attributes
-        full_id = xml_root.find("identity").attrib
-
-        # Get all Id items (name, nationality)
-        for item in xml_root.findall("identity/*"):
-            full_id[item.tag] = item.text
-
-        # Delete photo; large and not nessessary.
-        # COMBAK: Delete or not?
-        del full_id["photo"]
-
-        # Get address
-        for item in xml_root.findall("address/*"):
-            full_id[item.tag] = item.text
-
-        # Print firs and last name and address.
-        print("First name\t", full_id["firstname"])
-        print("Last name\t", full_id["name"])
-        print(
-            "Address\t",
-            full_id["streetandnumber"],
-            full_id["zip"],
-            full_id["municipality"],
-        )
+            # Wait for the file to exist.
+            while not os.path.exists(EID_PATH):
+                logging.info("eID path still not existing")
+                time.sleep(1)
 
-        # Cleanup temp eID file.
-        os.remove(EID_PATH)
+            # Parse eID file to XML and get it's root.
+            logging.info(
+                "eID XML at %s %s", EID_PATH, os.path.exists(EID_PATH)
+            )
+            xml_file = ET.parse(EID_PATH)
+            xml_root = xml_file.getroot()
+
+            # Start full_id dictionnary with identity attributes
+            full_id = xml_root.find("identity").attrib
+
+            # Get all Id items (name, nationality)
+            for item in xml_root.findall("identity/*"):
+                full_id[item.tag] = item.text
+
+            # Delete photo; large and not nessessary.
+            # COMBAK: Delete or not?
+            del full_id["photo"]
+
+            # Get address
+            for item in xml_root.findall("address/*"):
+                full_id[item.tag] = item.text
+
+            # Print firs and last name and address.
+            print("First name\t", full_id["firstname"])
+            print("Last name\t", full_id["name"])
+            print(
+                "Address\t",
+                full_id["streetandnumber"],
+                full_id["zip"],
+                full_id["municipality"],
+            )
+
+            # Cleanup temp eID file.
+            os.remove(EID_PATH)
+
+            # Check that the patient was not already registered today.
+            if daily_index.contains(
+                "nationalnumber", full_id["nationalnumber"]
+            ):
+                logging.warning("Patient already registered today!")
+                print("This patient was already registered today!")
+                check_in = scanner.prompt("Register again? [yes/no] ")
+                if not check_in.lower().startswith("y"):
+                    profiler.skip_patient()
+                    scanner.clear_tubes()
+                    continue
+
+            # Check eID data locally before anything remote.
+            _, errors = validate(full_id)
+            if errors:
+                logging.warning("Invalid eID data: %s", errors)
+                for message in errors.values():
+                    print(message)
+                check_in = scanner.prompt("Continue anyway? [yes/no] ")
+                if not check_in.lower().startswith("y"):
+                    profiler.skip_patient()
+                    scanner.clear_tubes()
+                    continue
+
+            # Start journaling this patient.
+            journal.begin()
+            journal.record("eid", full_id)
         # ---------- END eID Fetching ----------
 
         # ---------- START phone and email fetching ----------
-        # Let user select patient
-        logging.info("Swiching to Mediris")
-        maximize(drivers["mediris"])
-        get_doctor_info = False
+        profiler.section("mediris")
+        prefetched = None
+        if prefetcher is not None:
+            prefetched = prefetcher.get(full_id["nationalnumber"])
+        if prefetched is None and mediris_client is not None:
+            prefetched = fetch_mediris(full_id["nationalnumber"])
+
+        if "mediris" in resumed:
+            full_id.update(resumed["mediris"])
+        elif prefetched is not None:
+            # Already read from the waiting room or the API.
+            logging.info("Using prefetched Mediris data")
+            print("Select the patient in Mediris.")
+            full_id["phone"] = prefetched["phone"]
+            full_id["email"] = prefetched["email"]
+
+            # Get missing info.
+            if not full_id["phone"]:
+                full_id["phone"] = scanner.prompt("Phone number: ")
+            if not full_id["email"]:
+                full_id["email"] = scanner.prompt("Email address: ")
+        else:
+            # Let user select patient
+            logging.info("Swiching to Mediris")
+            maximize(drivers["mediris"])
+            get_doctor_info = False
 
-        while True:
-            # Wait for user to select the patient
-            # Checked by looking for the patent tab.
-            logging.info("Waiting for patient select")
             while True:
-                try:
-                    drivers["mediris"].find_element_by_xpath(
-                        '//*[@id="patientCrumb"]'
-                    ).click()
-                except NoSuchElementException:
-                    pass
-                else:
-                    minimize(drivers["mediris"])
-                    break
+                # Wait for user to select the patient
+                # Checked by looking for the patent tab.
+                logging.info("Waiting for patient select")
+                while True:
+                    try:
+                        locators.find(
+                            drivers["mediris"], "mediris.patient_tab"
+                        ).click()
+                    except NoSuchElementException:
+                        pass
+                    else:
+                        minimize(drivers["mediris"])
+                        break
 
-            # COMBAK: Can fetch w/o user interaction?
-            # Make input fields accessible by keyboard (allow editing).
-            logging.info("Attempting edit mode.")
-            try:
-                drivers["mediris"].find_element_by_xpath(
-                    "/html/body/div[2]/div[2]/div[3]/div[3]/div[1]/div[1]/div/a"
-                ).click()
-            except NoSuchElementException:
-                # If it fails, try backup button.
-                logging.info("Failed edit mode.")
+                # COMBAK: Can fetch w/o user interaction?
+                # Make input fields accessible by keyboard (allow editing).
+                logging.info("Attempting edit mode.")
                 try:
-                    drivers["mediris"].find_element_by_xpath(
-                        '//*[@id="inputRijksregisternummer"]'
-                    ).send_keys()
-                except ElementNotInteractableException:
-                    # If backup button fails, ask to enter information manually
-                    logging.warning("Switching to manual entry.")
-                    check = True
-                    while check:
-                        # Start by verifying natianl registry number.
-                        if str(full_id["nationalnumber"]) != input(
-                            "National Number:\t"
-                        ):
-                            logging.warning("National Numbers do not match!")
-                            print("The national numbers do not match!")
-                            continue
+                    locators.click(drivers["mediris"], "mediris.edit_mode")
+                except NoSuchElementException:
+                    # If it fails, try backup button.
+                    logging.info("Failed edit mode.")
+                    try:
+                        locators.find(
+                            drivers["mediris"], "mediris.national_number"
+                        ).send_keys()
+                    except ElementNotInteractableException:
+                        # If backup button fails,
+                        # ask to enter information manually
+                        logging.warning("Switching to manual entry.")
+                        check = True
+                        while check:
+                            # Start by verifying natianl registry number.
+                            national_number = scanner.prompt(
+                                "National Number:\t"
+                            )
+                            if (
+                                str(full_id["nationalnumber"])
+                                != national_number
+                            ):
+                                logging.warning(
+                                    "National Numbers do not match!"
+                                )
+                                print("The national numbers do not match!")
+                                continue
 
-                        # Ask phone and email.
-                        full_id["phone"] = input("Phone Number:\t")
-                        full_id["email"] = input("Email Address:\t")
+                            # Ask phone and email.
+                            full_id["phone"] = scanner.prompt(
+                                "Phone Number:\t"
+                            )
+                            full_id["email"] = scanner.prompt(
+                                "Email Address:\t"
+                            )
 
-                        # Ask confirmation
-                        while check:
-                            check_in = input("Is this correct? [yes/no]: ")
-                            if check_in.lower().startswith("y"):
-                                check = False
-                            elif check_in.lower().startswith("n"):
-                                break
-                            else:
-                                print("Input not recognized, use: `Yes`/`No`.")
+                            # Ask confirmation
+                            while check:
+                                check_in = scanner.prompt(
+                                    "Is this correct? [yes/no]: "
+                                )
+                                if check_in.lower().startswith("y"):
+                                    check = False
+                                elif check_in.lower().startswith("n"):
+                                    break
+                                else:
+                                    print(
+                                        "Input not recognized, use: `Yes`/`No`."
+                                    )
+                    else:
+                        get_doctor_info = True
                 else:
                     get_doctor_info = True
-            else:
-                get_doctor_info = True
-
-            if get_doctor_info:
-                # Copy registry number to clipboard.
-                drivers["mediris"].find_element_by_xpath(
-                    '//*[@id="inputRijksregisternummer"]'
-                ).send_keys(Keys.CONTROL, "a", "c")
-
-                # Verify register number fom clipboard.
-                if full_id["nationalnumber"] != pyperclip.paste():
-                    print(
-                        "The national numbers do not match!",
-                        "Did you select the correct patient?",
-                    )
-                    time.sleep(3)
-                    maximize(drivers["mediris"])
-                    input("Select patient and click edit mode")
-                    minimize(drivers["mediris"])
-                    continue
 
-                # Copy phone to clipboard.
-                drivers["mediris"].find_element_by_xpath(
-                    '//*[@id="inputTelefoonnummer"]'
-                ).send_keys(Keys.CONTROL, "a", "c")
-                # Fetch phone fom clipboard. If it is the registry number
-                # no phone is entered, so set to "".
-                full_id["phone"] = pyperclip.paste()
-                if full_id["phone"] == full_id["nationalnumber"]:
-                    logging.warning("No phone selected!")
-                    full_id["phone"] = ""
-
-                # Copy email to clipboard.
-                drivers["mediris"].find_element_by_xpath(
-                    '//*[@id="inputEmail"]'
-                ).send_keys(Keys.CONTROL, "a", "c")
-                full_id["email"] = pyperclip.paste()
-                # Fetch email form clipboard. If it is the phone
-                # or the registry number, no email entered, so set to "".
-                if full_id["email"] in (
-                    full_id["phone"],
-                    full_id["nationalnumber"],
-                ):
-                    full_id["email"] = ""
-                    logging.warning("No email address selected!")
+                if get_doctor_info:
+                    # Copy registry number to clipboard.
+                    locators.find(
+                        drivers["mediris"], "mediris.national_number"
+                    ).send_keys(Keys.CONTROL, "a", "c")
+
+                    # Verify register number fom clipboard.
+                    if full_id["nationalnumber"] != pyperclip.paste():
+                        print(
+                            "The national numbers do not match!",
+                            "Did you select the correct patient?",
+                        )
+                        time.sleep(3)
+                        maximize(drivers["mediris"])
+                        scanner.prompt("Select patient and click edit mode")
+                        minimize(drivers["mediris"])
+                        continue
 
-                # Get missing info.
-                if not full_id["phone"]:
-                    full_id["phone"] = input("Phone number: ")
-                if not full_id["email"]:
-                    full_id["email"] = input("Email address: ")
+                    # Copy phone to clipboard.
+                    locators.find(
+                        drivers["mediris"], "mediris.phone"
+                    ).send_keys(Keys.CONTROL, "a", "c")
+                    # Fetch phone fom clipboard. If it is the registry number
+                    # no phone is entered, so set to "".
+                    full_id["phone"] = pyperclip.paste()
+                    if full_id["phone"] == full_id["nationalnumber"]:
+                        logging.warning("No phone selected!")
+                        full_id["phone"] = ""
+
+                    # Copy email to clipboard.
+                    locators.find(
+                        drivers["mediris"], "mediris.email"
+                    ).send_keys(Keys.CONTROL, "a", "c")
+                    full_id["email"] = pyperclip.paste()
+                    # Fetch email form clipboard. If it is the phone
+                    # or the registry number, no email entered, so set to "".
+                    if full_id["email"] in (
+                        full_id["phone"],
+                        full_id["nationalnumber"],
+                    ):
+                        full_id["email"] = ""
+                        logging.warning("No email address selected!")
+
+                    # Get missing info.
+                    if not full_id["phone"]:
+                        full_id["phone"] = scanner.prompt("Phone number: ")
+                    if not full_id["email"]:
+                        full_id["email"] = scanner.prompt("Email address: ")
+
+                    # break free of the loop.
+                    break
 
-                # break free of the loop.
+        # Check and normalize contact data, ask again what is not valid.
+        while True:
+            contact, errors = validate(
+                {"phone": full_id["phone"], "email": full_id["email"]}
+            )
+            if not errors:
                 break
+            logging.warning("Invalid contact data: %s", errors)
+            for field, message in errors.items():
+                print(message)
+                full_id[field] = scanner.prompt(f"{field.title()}: ")
+        full_id.update(contact)
 
         logging.info("After info fetching, full_id: %s", full_id)
+        journal.record(
+            "mediris", {"phone": full_id["phone"], "email": full_id["email"]}
+        )
         # ---------- END phone and email fetching ----------
 
         # ---------- START Doctor Fetching ----------
-        # Go to Doctor section
-        logging.info("Fetching Doctor")
-        try:
-            drivers["mediris"].find_element_by_xpath(
-                '//*[@id="huisartsCrumb"]'
-            ).click()
-        except ElementClickInterceptedException:
-            # If it fails, use backup button.
-            logging.warning("Switching to backup button")
+        profiler.section("doctor")
+        if prefetched is not None and "doctor" not in resumed:
+            # The GP's INAMI search is warmed too.
+            full_id["doctor"] = prefetched["doctor"]
+        elif "doctor" not in resumed:
+            # Go to Doctor section
+            logging.info("Fetching Doctor")
             try:
-                drivers["mediris"].find_element_by_xpath(
-                    "/html/body/div[2]/div[2]/div[3]/div[1]/a[2]/span[2]"
-                ).click()
-            except ElementClickInterceptedException:
-                # If the backup button fails, ask to select it.
+                # Tries the backup button if needed.
+                locators.click(drivers["mediris"], "mediris.doctor_tab")
+            except (
+                ElementClickInterceptedException,
+                NoSuchElementException,
+            ):
+                # If the buttons fail, ask to select it.
+                logging.warning("Could not select doctor tab")
                 maximize(drivers["mediris"])
-                input("Select Doctor tab")
+                scanner.prompt("Select Doctor tab")
                 minimize(drivers["mediris"])
 
-        # Get selected doctor text
-        for attempt in range(2):
-            try:
-                # Try to get the doctor name text.
-                full_id["doctor"] = (
-                    drivers["mediris"]
-                    .find_element_by_xpath(
-                        (
-                            "/html/body/div[2]/div[2]/div[3]/div[3]/div[5]"
-                            "/div[1]/div[1]/span[1]"
-                        )
-                    )
-                    .text
-                )
-            except NoSuchElementException:
-                #  If it fails, try the backup location.
+            # Get selected doctor text
+            for attempt in range(2):
                 try:
-                    full_id["doctor"] = (
-                        drivers["mediris"]
-                        .find_element_by_xpath(
-                            (
-                                "/html/body/div[2]/div[2]/div[3]/div[3]/div[5]"
-                                "/div[2]/div[1]/span[1]"
-                            )
-                        )
-                        .text
-                    )
+                    # Try to get the doctor name text, or its backup location.
+                    full_id["doctor"] = locators.find(
+                        drivers["mediris"], "mediris.doctor_name"
+                    ).text
                 except NoSuchElementException:
                     # Ask to check/confirm that no doctor is selected.
                     # Cannot select an specialized doctor.
@@ -468,93 +873,21 @@ try:
                         ("check", "confirm")[attempt],
                     )
 
-                    input(
+                    scanner.prompt(
                         "No Doctor selected. Please %s."
                         % (("check", "confirm")[attempt])
                     )
                     full_id["doctor"] = ""
-            else:
-                break
+                else:
+                    break
         # ---------- END Doctor Fetching ----------
 
         # ---------- START Doctor and nihdi number fetching ----------
-        if full_id["doctor"]:
-            # --- START Decompose doctor's name. ---
-            # Conform user input.
-            full_name = full_id["doctor"]
-            full_name = (
-                full_name.lower().replace("dr.", "").replace(" -", "").strip()
-            )
-            logging.info("After confoming, user input is %s", full_name)
-
-            # Convert to list
-            name_list = full_name.split()
-            logging.info("Splitting name into %s", name_list)
-
-            # Decompostion for 3 names
-            # [0] = last name
-            # [1] = first name
-            # [2] = middle name
-
-            # Tuple of "train words" in family names.
-            unions = (
-                "van",
-                "den",
-                "vanden",
-                "vande",
-                "de",
-                "du",
-                "la",
-                "le",
-                "dela",
-                "de la",
-            )
-
-            name_list_edited = []
-            name_combinig = ""
-            jump = False
-            # Iterate the names.
-            for name in name_list:
-                # Ouput (too much) debugging data.
-                logging.info("Current name %s", name)
-                logging.info("Is union: %s", name in unions)
-                logging.info(
-                    "Edited names list: %s",
-                    name_list_edited,
-                )
-                logging.info("We are%s juming." % ("" if jump else "n't"))
-
-                # If the current name is a "train word",
-                # concatenate it with previous.
-                if name in unions:
-                    name_combinig += " " + name
-                    logging.info("Combined name: %s", name_combinig)
-                    jump = True
-                elif jump:
-                    # Finish combining names and append to names list.
-                    name_combinig += " " + name
-                    name_combinig = name_combinig.strip()
-                    name_list_edited.append(name_combinig)
-                    jump = False
-                    continue
-                else:
-                    # Just append the name. #You'reNotSpecial
-                    name_list_edited.append(name)
-
-            # Try to access middle name, else create empty middle name.
-            try:
-                name_list_edited[2]
-            except IndexError:
-                logging.info("No middle name")
-                name_list_edited.append("")
-
-            # Return names dictionnary.
-            doc_search = {
-                "firstname": name_list_edited[1],
-                "lastname": name_list_edited[0],
-                "middlename": name_list_edited[2],
-            }
-            # --- END Decompose Doctor's name ---
+        if "doctor" in resumed:
+            full_id.update(resumed["doctor"])
+        elif full_id["doctor"]:
+            # Decompose doctor's name.
+            doc_search = decompose_doctor_name(full_id["doctor"])
 
             # Search NIHDI number. Pass middlename key.
             for attempt in range(3):
@@ -581,23 +914,15 @@ try:
                         raise KeyError(e)
 
                 # --- START Doctor search ---
-                # copy INAMI_BASE_URL - Need the other as template.
-                search_url = INAMI_BASE_URL
-
-                # Add the search data into the URL.
-                for key, value in inami_search_data.items():
-                    if (
-                        value and key != "middlename"
-                    ):  # Cannot add middle names.
-                        search_url += "&" + key + "=" + value
-
-                # Warn if the search is empty (270000+ results :P)
-                if search_url == INAMI_BASE_URL:
-                    print(EmptySearchWarning())
-
-                # Get the page and parse it to BeautifulSoup.
-                page = requests.get(search_url)
-                soup = BeautifulSoup(page.text, "html.parser")
+                # Get the page (encoded, cached) and parse it to BeautifulSoup.
+                try:
+                    page_text = inami_client.search(inami_search_data)
+                except requests.RequestException as e:
+                    # Offline (or not recorded when replaying), ask the user.
+                    logging.warning("INAMI search failed: %s", e)
+                    print("INAMI search unavailable.")
+                    page_text = ""
+                soup = BeautifulSoup(page_text, "html.parser")
 
                 # Iterate all medical staff (devided into div-s class col-sm-4)
                 medical_staff_list = []
@@ -779,13 +1104,13 @@ try:
                             print_out = False
 
                         # Let user check names.
-                        check_in = input("Is this correct? [yes/no] ")
+                        check_in = scanner.prompt("Is this correct? [yes/no] ")
                         if check_in.lower().strip().startswith("y"):
                             check = False
                         elif check_in.lower().strip().startswith("n"):
                             # Else let user correct.
                             for key in doc_search.keys():
-                                doc_search[key] = input(
+                                doc_search[key] = scanner.prompt(
                                     f"Enter Doctor's {key}: "
                                 )
                             print_out = True
@@ -795,7 +1120,7 @@ try:
                     # Not found, ask for INAMI.
                     if doc_search == doc_search_auto:
                         doc_out = doc_search.copy()
-                        doc_out["inami"] = input("INAMI: ")
+                        doc_out["inami"] = scanner.prompt("INAMI: ")
                     else:
                         # Otherwise search again.
                         continue
@@ -812,65 +1137,104 @@ try:
             full_id["doctor"] = ""
             full_id["inami"] = ""
             logging.info("Skipping Search, no doctor selected")
+        journal.record(
+            "doctor", {"doctor": full_id["doctor"], "inami": full_id["inami"]}
+        )
         # --------- END Doctor nihdi number fetching ----------
 
         # ---------- START Test Tube ID ----------
+        profiler.section("test_tube")
         # Get test tube ID
-        attempt = 0
-        while True:
-            logging.info("Predicting test tube ID: %s", test_tube_predict)
-            full_id["test_tube"] = input(
-                f"Test tube code ({test_tube_predict}): "
-            )
-            # If input empty, use predicted test tube.
-            if not full_id["test_tube"] and test_tube_predict:
-                full_id["test_tube"] = test_tube_predict
-            if not full_id["test_tube"] and not test_tube_predict:
-                print("Prediction only works when not empty...")
-                continue
-            logging.info("Got test tube %s", full_id["test_tube"])
-
-            # Correctly format test tubes.
-            if (char := full_id["test_tube"][3]) != "-":
-                full_id["test_tube"].replace(char, "-")
-
-            # Assert test tube starts with CD and ends in M.
-            if not (
-                full_id["test_tube"].startswith("C19")
-                and full_id["test_tube"].endswith("M")
-            ):
-                print("This is not a valid code...")
-                attempt += 1
-            else:
-                # Set next test tube ID prediction into memory.
-                test_tube_decompse = full_id["test_tube"].split("-")
-                for i, item in enumerate(test_tube_decompse):
-                    if item.isdigit():
-                        previous_length = len(item)
-                        test_tube_decompse[i] = str(
-                            int(test_tube_decompse[i]) + 1
-                        )
-                        break
-
-                while len(test_tube_decompse[i]) < previous_length:
-                    test_tube_decompse[i] = "0" + test_tube_decompse[i]
+        if "test_tube" in resumed:
+            full_id["test_tube"] = resumed["test_tube"]["test_tube"]
+        else:
+            attempt = 0
+            while True:
+                if tube_allocator is not None:
+                    # Skip codes another desk took meanwhile.
+                    test_tube_predict = tube_allocator.next_free(
+                        test_tube_predict
+                    )
+                logging.info("Predicting test tube ID: %s", test_tube_predict)
+                full_id["test_tube"] = scanner.prompt_tube(
+                    f"Test tube code ({test_tube_predict}): "
+                )
+                # If input empty, use predicted test tube.
+                if not full_id["test_tube"] and test_tube_predict:
+                    full_id["test_tube"] = test_tube_predict
+                if not full_id["test_tube"] and not test_tube_predict:
+                    print("Prediction only works when not empty...")
+                    continue
+                logging.info("Got test tube %s", full_id["test_tube"])
 
-                test_tube_predict = "-".join(test_tube_decompse)
-                break
+                # Correctly format test tubes.
+                if (char := full_id["test_tube"][3]) != "-":
+                    full_id["test_tube"].replace(char, "-")
 
-            if attempt > 1:
-                # Let user overwrite Not asserted ID.
-                if input("Overwrite? [yes/no]").lower().startswith("y"):
-                    logging.warning("User Overwrote program.")
+                # Assert test tube starts with CD and ends in M.
+                if not (
+                    full_id["test_tube"].startswith("C19")
+                    and full_id["test_tube"].endswith("M")
+                ):
+                    print("This is not a valid code...")
+                    attempt += 1
+                elif daily_index.contains("test_tube", full_id["test_tube"]):
+                    logging.warning("Test tube already used today!")
+                    print("This test tube was already used today...")
+                    attempt += 1
+                elif tube_allocator is not None and not tube_allocator.claim(
+                    full_id["test_tube"], args.desk
+                ):
+                    print("This test tube is used by another desk...")
+                    attempt += 1
+                else:
+                    # Set next test tube ID prediction into memory.
+                    test_tube_predict = next_tube(full_id["test_tube"])
                     break
+
+                if attempt > 1:
+                    # Let user overwrite Not asserted ID.
+                    check_in = scanner.prompt("Overwrite? [yes/no]")
+                    if check_in.lower().startswith("y"):
+                        logging.warning("User Overwrote program.")
+                        break
+            journal.set_state(test_tube_predict=test_tube_predict)
+        journal.record("test_tube", {"test_tube": full_id["test_tube"]})
         # ---------- END Test Tube ID ----------
 
         # ---------- START Form fillout ----------
+        profiler.section("form")
+        submitted = "submitted" in resumed
+        if covrecord_client is not None and not submitted:
+            # Register over HTTP, the browser form is only printed.
+            try:
+                covrecord_client.submit(full_id, FIELD_IDS, SAVE_BUTTON)
+            except CovRecordUnconfirmed as e:
+                # Sent, but may or may not be saved. Saving it again in
+                # the browser could register the patient twice.
+                logging.warning("Direct submission unconfirmed: %s", e)
+                print("Direct registration not confirmed:", e)
+                print(
+                    "Look up test tube", full_id["test_tube"], "in CovRecord."
+                )
+                check_in = scanner.prompt("Is it registered? [yes/no] ")
+                submitted = check_in.lower().startswith("y")
+            except (CovRecordError, requests.RequestException) as e:
+                # Failed before sending anything.
+                logging.warning("Direct submission failed: %s", e)
+                print("Direct registration failed, using the browser.")
+            else:
+                submitted = True
+            if submitted:
+                journal.record("submitted", {})
+
         # write all values to CovRecord form.
         logging.info("Wirting out")
-        for element, field in FIELDS.items():
+        for element in FIELDS:
             # Find element, clear feld and write value.
-            cur_field = drivers["covrecord"].find_element_by_xpath(field)
+            cur_field = locators.find(
+                drivers["covrecord"], "covrecord.field." + element
+            )
             cur_field.clear()
             try:
                 cur_field.send_keys(full_id[element])
@@ -885,33 +1249,41 @@ try:
         # Maximize window for user interaction.
         maximize(drivers["covrecord"])
 
-        # Send to printer.
-        logging.info("Sending print")
-        drivers["covrecord"].find_element_by_css_selector(
-            BUTTONS["print"]
-        ).click()
+        if submitted:
+            # The print button submits the form too, print the page only.
+            logging.info("Printing page")
+            drivers["covrecord"].execute_script("setTimeout(window.print)")
+            print("Registered. Print only, do not save again!")
+        else:
+            # Send to printer, also saves the registration. Once saved, a
+            # resumed patient is only printed again.
+            logging.info("Sending print")
+            locators.click(drivers["covrecord"], "covrecord.button.print")
+            journal.record("submitted", {})
+
+        # Never add the test to another patient's record.
+        check_mediris_patient(full_id["nationalnumber"])
 
         # Select Corona form on Mediris
         logging.info("Selecting Corona form")
         try:
-            drivers["mediris"].find_element_by_xpath(
-                '//*[@id="anderebehandelingCrumb"]'
-            ).click()
-        except ElementClickInterceptedException:
+            locators.click(drivers["mediris"], "mediris.other_treatment_tab")
+        except (ElementClickInterceptedException, NoSuchElementException):
             # Let user finalize Mediris form.
             # NOTE: Not maximizing because user busy with CovRecord from.
-            input("Select other treatement tab")
+            scanner.prompt("Select other treatement tab")
 
         # Add other treatement.
-        drivers["mediris"].find_element_by_xpath(
-            (
-                "/html/body/div[2]/div[2]/div[3]/div[3]/div[12]/div[2]/table/"
-                "tbody/tr/td[4]/a"
-            )
-        ).click()
+        locators.click(drivers["mediris"], "mediris.add_other_treatment")
+        ledger.append(full_id, args.desk)
+        daily_index.add("nationalnumber", full_id["nationalnumber"])
+        daily_index.add("test_tube", full_id["test_tube"])
+        journal.record("done", {})
 
         # ---------- Cleanup ----------
         logging.info("Cleaning up")
+        profiler.stop_patient()
+        locators.save()
         try:
             del doc_out
         except NameError:
@@ -920,22 +1292,45 @@ try:
 except KeyboardInterrupt:
     print("Quitting")
     logging.info("Quitting")
+    journal.close()
+    profiler.close()
+    locators.save()
+    watchdog.stop()
+    if prefetcher is not None:
+        prefetcher.stop()
+    ledger.close()
     for key, driver in drivers.items():
         driver.close()
 
 except SystemExit:
     print("Quitting")
     logging.info("Quitting")
+    journal.close()
+    profiler.close()
+    locators.save()
+    watchdog.stop()
+    if prefetcher is not None:
+        prefetcher.stop()
+    ledger.close()
     for key, driver in drivers.items():
         driver.close()
 
 except Exception as e:
     logging.critical(e)
+    # Patient progress is in the journal, resumed on restart.
+    journal.close()
+    profiler.close()
+    locators.save()
+    watchdog.stop()
+    if prefetcher is not None:
+        prefetcher.stop()
+    ledger.close()
+    print("Crashed! Restart to resume the current patient.")
     now_string = (
         str(datetime.datetime.now()).replace(" ", "_").replace(":", "-")
     )
     shutil.copyfile(
-        f"{__file__}.log",
+        LOG_PATH,
         f"{WORK_DIR}\\errors\\{now_string}-ERROR.log",
     )
     # Reraise last error.
@@ -0,0 +1,181 @@
+# File: covrecord_http
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Browserless CovRecord registration over a pooled HTTP session.
+# The form is scraped for its field names and hidden (CSRF) inputs, so only
+# the field ids need to be known. They come from the covrecord.field
+# locators.
+# A registration is only confirmed if the answer is not the login page, has
+# no error message and does not give our form back still filled in.
+# Errors once the registration is sent raise CovRecordUnconfirmed: it may
+# have been saved anyway, so it must not be sent again blindly.
+# -----------------------
+import logging
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+# Error messages on a refused form.
+ERRORS = ".alert-danger, .has-error"
+
+
+class CovRecordError(Exception):
+    """Error when talking to CovRecord directly."""
+
+
+class CovRecordUnconfirmed(CovRecordError):
+    """Error after sending a registration, it may be saved."""
+
+
+class CovRecordClient:
+    """CovRecord registration client."""
+
+    def __init__(self, url, pool_size=4, timeout=10):
+        """Initialize client on the CovRecord page `url`.
+
+        `timeout` is the requests timeout in seconds.
+        """
+        self.url = url
+        self.timeout = timeout
+        self.credentials = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def load_cookies(self, cookies):
+        """Reuse a browser session. `cookies` as from `get_cookies()`."""
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+            )
+
+    def _get_form(self, field_id):
+        """Get the form holding the input `field_id` and its page URL."""
+        page = self.session.get(self.url, timeout=self.timeout)
+        page.raise_for_status()
+        soup = BeautifulSoup(page.text, "html.parser")
+        field = soup.find(id=field_id)
+        if field is None:
+            return None, page.url
+        return field.find_parent("form"), page.url
+
+    @staticmethod
+    def _form_data(form):
+        """Get the default data of a form, hidden inputs included."""
+        data = {}
+        for field in form.find_all(("input", "select", "textarea")):
+            name = field.get("name")
+            if not name or field.get("type") in ("submit", "button"):
+                continue
+            if field.name == "select":
+                option = field.find("option", selected=True)
+                data[name] = option.get("value", "") if option else ""
+            else:
+                data[name] = field.get("value", "")
+        return data
+
+    def _post(self, form, page_url, data):
+        """Post `data` with the form's method and action."""
+        action = urljoin(page_url, form.get("action") or page_url)
+        method = (form.get("method") or "post").lower()
+        if method == "get":
+            response = self.session.get(
+                action, params=data, timeout=self.timeout
+            )
+        else:
+            response = self.session.post(
+                action, data=data, timeout=self.timeout
+            )
+        response.raise_for_status()
+        return response
+
+    def login(self, user, password):
+        """Login with the `username` and `password` form."""
+        logging.info("Logging in to CovRecord over HTTP")
+        self.credentials = (user, password)
+        form, page_url = self._get_form("username")
+        if form is None:
+            logging.info("Already logged in to CovRecord")
+            return
+
+        data = self._form_data(form)
+        data[form.find(id="username")["name"]] = user
+        data[form.find(id="password")["name"]] = password
+        response = self._post(form, page_url, data)
+        if BeautifulSoup(response.text, "html.parser").find(id="username"):
+            raise CovRecordError("CovRecord login failed")
+
+    def submit(self, record, fields, save_button=None):
+        """Register `record` directly.
+
+        `fields` maps `record` keys to the form field ids.
+        `save_button` is the CSS selector of the form's save button.
+        """
+        first_id = next(iter(fields.values()))
+
+        form, page_url = self._get_form(first_id)
+        if form is None:
+            # Session expired, login again if we can.
+            if self.credentials is None:
+                raise CovRecordError("CovRecord session expired")
+            self.login(*self.credentials)
+            form, page_url = self._get_form(first_id)
+            if form is None:
+                raise CovRecordError("CovRecord form not found")
+
+        # Start from the form defaults, keeps any CSRF token.
+        data = self._form_data(form)
+        for key, field_id in fields.items():
+            field = form.find(id=field_id)
+            if field is None or not field.get("name"):
+                raise CovRecordError(f"CovRecord field {field_id} not found")
+            data[field["name"]] = record.get(key, "")
+
+        # Send the save button, like a click would.
+        if save_button is not None:
+            button = form.select_one(save_button)
+            if button is not None and button.get("name"):
+                data[button["name"]] = button.get("value", "")
+
+        logging.info("Submitting %s to CovRecord", record.get("test_tube"))
+        try:
+            response = self._post(form, page_url, data)
+            self._confirm(response, form, data)
+        except (CovRecordError, requests.RequestException) as e:
+            raise CovRecordUnconfirmed(str(e)) from e
+        return response
+
+    @staticmethod
+    def _confirm(response, form, data):
+        """Raise CovRecordError unless `response` confirms the save."""
+        soup = BeautifulSoup(response.text, "html.parser")
+        if soup.find(id="username"):
+            raise CovRecordError("CovRecord session expired")
+
+        error = soup.select_one(ERRORS)
+        if error is not None:
+            raise CovRecordError(
+                "CovRecord refused: " + error.get_text(" ", strip=True)
+            )
+
+        # Refused forms come back with what was sent.
+        for field in form.find_all("input", id=True):
+            name = field.get("name")
+            if not data.get(name) or field.get("type") == "hidden":
+                continue
+            answer = soup.find(id=field["id"])
+            if answer is None or answer.get("value") != data[name]:
+                return
+        raise CovRecordError("CovRecord gave the form back, not saved")
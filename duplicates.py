@@ -0,0 +1,129 @@
+# File: duplicates
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Same-day duplicate registration detector.
+# Keeps one file per day of 8 byte keyed hashes of registered national
+# numbers and tube codes. Without the key, national numbers cannot be
+# found back by hashing them all. Desks sharing the directory (and key)
+# append under a file lock and pick up each other's entries on every check.
+# Past days files are deleted.
+# -----------------------
+import os
+import logging
+import datetime
+import contextlib
+from hashlib import blake2b
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# Size of a hashed entry in bytes.
+DIGEST_SIZE = 8
+
+
+@contextlib.contextmanager
+def locked(file):
+    """Hold an exclusive lock on an open file."""
+    if msvcrt is not None:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def digest(kind, value, key=b""):
+    """Hash a conformed value of `kind` with `key`."""
+    value = "".join(str(value).split()).upper()
+    return blake2b(
+        f"{kind}:{value}".encode("utf-8"), digest_size=DIGEST_SIZE, key=key
+    ).digest()
+
+
+class DailyIndex:
+    """Index of what was registered today."""
+
+    def __init__(self, directory, key=None):
+        """Initialize index in `directory`. `key` is the hashing key."""
+        self.directory = directory
+        if key:
+            # blake2b keys are 64 bytes at most.
+            self.key = blake2b(key.encode("utf-8")).digest()
+        else:
+            logging.warning("Duplicate index without key")
+            self.key = b""
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.day = None
+        self._rollover()
+
+    def _rollover(self):
+        """Switch to a new day file if the day changed."""
+        today = datetime.date.today()
+        if today == self.day:
+            return
+        self.day = today
+        self.path = os.path.join(self.directory, f"{today.isoformat()}.idx")
+        self._entries = set()
+        self._offset = 0
+        logging.info("Duplicate index: %s", self.path)
+
+        # Past days are not needed anymore.
+        for name in os.listdir(self.directory):
+            if name.endswith(".idx") and name < f"{today.isoformat()}.idx":
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    # Another desk deleted it or still has it open.
+                    logging.info("Could not delete %s: %s", name, e)
+
+    def _refresh(self):
+        """Read entries appended since the last read, by any desk."""
+        try:
+            if os.path.getsize(self.path) <= self._offset:
+                return
+        except FileNotFoundError:
+            return
+
+        with open(self.path, "rb") as file:
+            file.seek(self._offset)
+            data = file.read()
+        # Only take whole entries, another desk may be writing.
+        end = len(data) - len(data) % DIGEST_SIZE
+        for i in range(0, end, DIGEST_SIZE):
+            self._entries.add(data[i : i + DIGEST_SIZE])
+        self._offset += end
+
+    def contains(self, kind, value):
+        """Check if `value` of `kind` was registered today."""
+        self._rollover()
+        self._refresh()
+        return digest(kind, value, self.key) in self._entries
+
+    def add(self, kind, value):
+        """Register `value` of `kind` for today."""
+        self._rollover()
+        entry = digest(kind, value, self.key)
+        with open(self.path, "ab") as file:
+            with locked(file):
+                file.seek(0, os.SEEK_END)
+                file.write(entry)
+                file.flush()
+        self._entries.add(entry)
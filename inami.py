@@ -0,0 +1,231 @@
+# File: inami
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# INAMI (NIHDI) SilverPages search client.
+# Searches are keyed on their canonical query so that retries hit a short
+# lived cache and identical concurrent searches share one request.
+# Requests time out, and so does waiting on another's request, so a hung
+# SilverPages never blocks the desks (they ask for the INAMI instead).
+# -----------------------
+import time
+import logging
+import threading
+import unicodedata
+from urllib.parse import quote, urlencode
+
+import requests
+
+# INAMI Search data
+INAMI_BASE_URL = (
+    r"https://ondpanon.riziv.fgov.be/SilverPages/fr/Home/"
+    r"SearchByForm?PageOffset=0&PageSize=200"
+)
+# Keys accepted by SilverPages, in canonical order.
+# NOTE: Middle names cannot be searched for.
+SEARCH_KEYS = (
+    "lastname",
+    "firstname",
+    "nihdinumber",
+    "where",
+    "qualification",
+)
+
+
+class EmptySearchWarning(Warning):
+    """Warning when generating an empty search."""
+
+    def __init__(self):
+        """Initialize warning class."""
+        super(EmptySearchWarning, self).__init__(
+            "Warning! You are generating an empty search url!"
+        )
+
+
+def build_search_query(search_data):
+    """Build the canonical, URL-encoded query string of a search."""
+    params = []
+    for key in SEARCH_KEYS:
+        value = search_data.get(key) or ""
+        # Conform value. NFC so "é" typed or pasted gives the same query.
+        value = unicodedata.normalize("NFC", str(value)).strip().lower()
+        if value:
+            params.append((key, value))
+
+    # Encode spaces as %20 and apostrophes, accents... as UTF-8 escapes.
+    return urlencode(params, quote_via=quote)
+
+
+def build_search_url(search_data):
+    """Build the full SilverPages search URL."""
+    query = build_search_query(search_data)
+    if not query:
+        return INAMI_BASE_URL
+    return INAMI_BASE_URL + "&" + query
+
+
+class _Flight:
+    """A search currently being fetched."""
+
+    def __init__(self):
+        """Initialize in-flight search."""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InamiSearchClient:
+    """SilverPages search client with result cache and request coalescing."""
+
+    def __init__(self, ttl=300, session=None, timeout=10):
+        """Initialize client.
+
+        `ttl` is the cache lifetime and `timeout` the request timeout, in
+        seconds.
+        """
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
+        self._cache = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def search(self, search_data):
+        """Get the search result page for `search_data` as text."""
+        query = build_search_query(search_data)
+        # Warn if the search is empty (270000+ results :P)
+        if not query:
+            print(EmptySearchWarning())
+
+        with self._lock:
+            # Serve still-valid results from cache.
+            cached = self._cache.get(query)
+            if cached is not None and cached[0] > time.monotonic():
+                logging.info("INAMI search cache hit: %s", query)
+                return cached[1]
+
+            # Join an identical search if one is already running.
+            flight = self._in_flight.get(query)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[query] = _Flight()
+
+        if not leader:
+            logging.info("INAMI search joining in-flight: %s", query)
+            # Connecting and reading may each take up to the timeout.
+            if not flight.done.wait(2 * self.timeout):
+                raise requests.Timeout(f"INAMI search still running: {query}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            url = build_search_url(search_data)
+            logging.info("INAMI search: %s", url)
+            page = self.session.get(url, timeout=self.timeout)
+            flight.result = page.text
+
+            # Only keep successful results.
+            if page.status_code == 200:
+                with self._lock:
+                    self._prune()
+                    self._cache[query] = (
+                        time.monotonic() + self.ttl,
+                        flight.result,
+                    )
+            else:
+                logging.warning("INAMI search returned %s", page.status_code)
+            return flight.result
+
+        except Exception as e:
+            flight.error = e
+            raise
+
+        finally:
+            with self._lock:
+                del self._in_flight[query]
+            flight.done.set()
+
+    def _prune(self):
+        """Drop expired cache entries. Call with the lock held."""
+        now = time.monotonic()
+        for query in [q for q, c in self._cache.items() if c[0] <= now]:
+            del self._cache[query]
+
+
+def decompose_doctor_name(full_name):
+    """Decompose a doctor's full name into a search dictionnary."""
+    # Conform user input.
+    full_name = full_name.lower().replace("dr.", "").replace(" -", "").strip()
+    logging.info("After confoming, user input is %s", full_name)
+
+    # Convert to list
+    name_list = full_name.split()
+    logging.info("Splitting name into %s", name_list)
+
+    # Decompostion for 3 names
+    # [0] = last name
+    # [1] = first name
+    # [2] = middle name
+
+    # Tuple of "train words" in family names.
+    unions = (
+        "van",
+        "den",
+        "vanden",
+        "vande",
+        "de",
+        "du",
+        "la",
+        "le",
+        "dela",
+        "de la",
+    )
+
+    name_list_edited = []
+    name_combinig = ""
+    jump = False
+    # Iterate the names.
+    for name in name_list:
+        # Ouput (too much) debugging data.
+        logging.info("Current name %s", name)
+        logging.info("Is union: %s", name in unions)
+        logging.info(
+            "Edited names list: %s",
+            name_list_edited,
+        )
+        logging.info("We are%s juming." % ("" if jump else "n't"))
+
+        # If the current name is a "train word",
+        # concatenate it with previous.
+        if name in unions:
+            name_combinig += " " + name
+            logging.info("Combined name: %s", name_combinig)
+            jump = True
+        elif jump:
+            # Finish combining names and append to names list.
+            name_combinig += " " + name
+            name_combinig = name_combinig.strip()
+            name_list_edited.append(name_combinig)
+            jump = False
+            continue
+        else:
+            # Just append the name. #You'reNotSpecial
+            name_list_edited.append(name)
+
+    # Create empty first (single name) and middle names if missing.
+    while len(name_list_edited) < 3:
+        logging.info("Missing first or middle name")
+        name_list_edited.append("")
+
+    # Return names dictionnary.
+    return {
+        "firstname": name_list_edited[1],
+        "lastname": name_list_edited[0],
+        "middlename": name_list_edited[2],
+    }
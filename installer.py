@@ -7,10 +7,11 @@
 # -----------------------
 
 import os
-import requests
 import json
 import shutil
 
+import cassette
+
 FUTURE_WORK_DIR = os.path.join(os.path.expandvars("%APPDATA%"), "covrecord")
 
 if not os.path.exists(FUTURE_WORK_DIR):
@@ -28,6 +29,9 @@ WORK_DIR = FUTURE_WORK_DIR
 with open("covrecord.auth", "r") as file:
     AUTH = json.load(file)
 
+# HTTP session, recorded/replayed if COVRECORD_CASSETTE is set.
+http_session = cassette.session()
+
 # ---------- START Auto-update ----------
 GITHUB_URL = (
     "https://api.github.com/repos/TheoTechnicguy/" "Etterbeek-Testing/releases"
@@ -42,7 +46,7 @@ header = {
 }
 
 # Get github repos w/ requests "GET" method.
-github_page = requests.get(GITHUB_URL, headers=header)
+github_page = http_session.get(GITHUB_URL, headers=header)
 
 # Check if all is ok (status_code 200)
 if github_page.status_code != 200:
@@ -60,7 +64,7 @@ else:
                     os.path.join(WORK_DIR, asset["name"]), "wb+"
                 ) as file:
                     file.write(
-                        requests.get(asset["browser_download_url"]).content
+                        http_session.get(asset["browser_download_url"]).content
                     )
                 print("Got", asset["name"])
 
@@ -0,0 +1,174 @@
+# File: journal
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Append-only, crash-safe journal of per-patient stage results.
+# Every record is one JSON line, flushed on write. fsync is batched and
+# forced when a patient is done. Done patients are compacted away, so eID
+# data is only kept while a patient is in progress.
+# -----------------------
+import os
+import time
+import json
+import uuid
+import logging
+import datetime
+
+# Patient stages, in order.
+STAGES = ("eid", "mediris", "doctor", "test_tube", "submitted", "done")
+
+
+class PatientJournal:
+    """Append-only journal of per-patient stage results."""
+
+    def __init__(self, path, sync_every=5, sync_interval=2.0):
+        """Initialize and load journal.
+
+        fsync is done every `sync_every` records or `sync_interval`
+        seconds, whichever comes first.
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        # Desk state, survives finished patients (e.g. tube prediction).
+        self.state = {}
+        # Current patient id and its stages results.
+        self.patient = None
+        self.stages = {}
+
+        self._load()
+        self._compact()
+        self._open()
+
+    def _load(self):
+        """Replay the journal file."""
+        patients = {}
+        order = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write at crash time, skip.
+                        logging.warning("Skipping bad journal line")
+                        continue
+
+                    if "state" in record:
+                        self.state.update(record["state"])
+                        continue
+
+                    patient = record["patient"]
+                    if patient not in patients:
+                        patients[patient] = {}
+                        order.append(patient)
+                    patients[patient][record["stage"]] = record["data"]
+        except FileNotFoundError:
+            return
+
+        # Only the last patient can be unfinished.
+        if not order:
+            return
+        patient = order[-1]
+        stages = patients[patient]
+        today = datetime.date.today().isoformat()
+        if "done" in stages or stages.get("begin", {}).get("day") != today:
+            return
+
+        self.patient = patient
+        self.stages = stages
+        logging.info("Journal: unfinished patient %s", patient)
+
+    def _compact(self):
+        """Rewrite journal with only the state and unfinished patient."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            if self.state:
+                file.write(json.dumps({"state": self.state}) + "\n")
+            for stage, data in self.stages.items():
+                file.write(self._dumps(stage, data))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _open(self):
+        """Open journal file for appending."""
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _dumps(self, stage, data):
+        """Serialize a stage record."""
+        return (
+            json.dumps(
+                {"patient": self.patient, "stage": stage, "data": data},
+                default=str,
+            )
+            + "\n"
+        )
+
+    def _write(self, line, force_sync=False):
+        """Append a line, flush and fsync if needed."""
+        self._file.write(line)
+        self._file.flush()
+        self._unsynced += 1
+        if (
+            force_sync
+            or self._unsynced >= self.sync_every
+            or time.monotonic() - self._last_sync >= self.sync_interval
+        ):
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def resumable(self):
+        """Return the unfinished patient's stages results, or None."""
+        if self.patient is None:
+            return None
+        return {k: v for k, v in self.stages.items() if k in STAGES}
+
+    def begin(self):
+        """Start a new patient."""
+        self.patient = uuid.uuid4().hex
+        self.stages = {}
+        self.record("begin", {"day": datetime.date.today().isoformat()})
+        logging.info("Journal: begin patient %s", self.patient)
+
+    def record(self, stage, data):
+        """Record a stage result for the current patient."""
+        self.stages[stage] = data
+        # Always sync what must not be redone.
+        self._write(
+            self._dumps(stage, data),
+            force_sync=stage in ("submitted", "done"),
+        )
+        if stage == "done":
+            self.discard()
+
+    def discard(self):
+        """Forget the current patient and drop its data from the file."""
+        if self.patient is not None:
+            logging.info("Journal: drop patient %s", self.patient)
+        self.patient = None
+        self.stages = {}
+        self._file.close()
+        self._compact()
+        self._open()
+
+    def set_state(self, **state):
+        """Record desk state values."""
+        self.state.update(state)
+        self._write(json.dumps({"state": state}, default=str) + "\n")
+
+    def close(self):
+        """Sync and close journal."""
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
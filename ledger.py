@@ -0,0 +1,140 @@
+# File: ledger
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Append-only registration ledger in a compact SQLite table.
+# No names, contact data or national numbers are kept. Given a key, the
+# national number is kept as a keyed hash to count returning patients.
+# -----------------------
+import time
+import hmac
+import sqlite3
+import logging
+import datetime
+from hashlib import sha256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    day TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    desk TEXT NOT NULL,
+    tube_prefix TEXT,
+    tube_number INTEGER,
+    patient TEXT,
+    inami TEXT,
+    zip TEXT,
+    gender TEXT,
+    birth_year INTEGER
+);
+CREATE INDEX IF NOT EXISTS registrations_day ON registrations (day, time);
+"""
+
+
+def split_tube(code):
+    """Split a tube code into its prefix and number."""
+    parts = code.split("-")
+    for i, part in enumerate(parts):
+        if part.isdigit():
+            return "-".join(parts[:i]), int(part)
+    return code, None
+
+
+class Ledger:
+    """Daily registration ledger."""
+
+    def __init__(self, path, key=None):
+        """Open ledger. `key` is the national number hashing key."""
+        self.key = key.encode("utf-8") if key else None
+        self.connection = sqlite3.connect(path, timeout=10)
+        # Write ahead log lets other desks read while we write.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def _hash(self, value):
+        """Hash a national number, None without key."""
+        if self.key is None or not value:
+            return None
+        digest = hmac.new(self.key, value.encode("utf-8"), sha256)
+        return digest.hexdigest()[:16]
+
+    def append(self, record, desk):
+        """Append a completed registration."""
+        now = time.time()
+        tube_prefix, tube_number = split_tube(record.get("test_tube", ""))
+        birth = str(record.get("dateofbirth", ""))
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO registrations"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    datetime.date.fromtimestamp(now).isoformat(),
+                    int(now),
+                    desk,
+                    tube_prefix,
+                    tube_number,
+                    self._hash(record.get("nationalnumber")),
+                    record.get("inami") or None,
+                    record.get("zip") or None,
+                    record.get("gender") or None,
+                    int(birth[:4]) if birth[:4].isdigit() else None,
+                ),
+            )
+        logging.info("Ledger: registered %s", record.get("test_tube"))
+
+    def query(self, sql, days):
+        """Run a stats query over the last `days` days."""
+        since = datetime.date.today() - datetime.timedelta(days=days - 1)
+        return self.connection.execute(sql, (since.isoformat(),)).fetchall()
+
+    def throughput(self, days=1):
+        """Get (day, hour, desk, count) registrations."""
+        return self.query(
+            "SELECT day, strftime('%H', time, 'unixepoch', 'localtime'),"
+            " desk, count(*) FROM registrations WHERE day >= ?"
+            " GROUP BY 1, 2, 3 ORDER BY 1, 2, 3",
+            days,
+        )
+
+    def tube_ranges(self, days=1):
+        """Get (day, desk, prefix, first, last, count) of tubes used."""
+        return self.query(
+            "SELECT day, desk, tube_prefix, min(tube_number),"
+            " max(tube_number), count(*) FROM registrations WHERE day >= ?"
+            " GROUP BY 1, 2, 3 ORDER BY 1, 2, 3",
+            days,
+        )
+
+    def doctors(self, days=1, limit=10):
+        """Get (inami, count) of the most frequent GPs."""
+        return self.query(
+            "SELECT coalesce(inami, 'none'), count(*) FROM registrations"
+            " WHERE day >= ? GROUP BY 1 ORDER BY 2 DESC LIMIT %d" % limit,
+            days,
+        )
+
+    def print_stats(self, days=1):
+        """Print throughput, tube usage and GP distribution."""
+        print(f"---------- Last {days} day(s) ----------")
+        print("\nTests per hour")
+        print("Day", "Hour", "Desk", "Tests", sep="\t")
+        for row in self.throughput(days):
+            print(*row, sep="\t")
+
+        print("\nTubes used")
+        print("Day", "Desk", "Prefix", "First", "Last", "Count", sep="\t")
+        for row in self.tube_ranges(days):
+            print(*row, sep="\t")
+
+        print("\nGeneral practitioners")
+        print("INAMI", "Patients", sep="\t")
+        for row in self.doctors(days):
+            print(*row, sep="\t")
+
+    def close(self):
+        """Close ledger."""
+        self.connection.close()
@@ -0,0 +1,151 @@
+# File: locators
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Adaptive page element locator registry.
+# Locators are configured in locators.json as a list of [by, value]
+# strategies. The last strategy that worked is tried first, then the most
+# successful ones. Statistics are kept between runs.
+# Safe to share between threads, each using its own driver.
+# -----------------------
+import os
+import time
+import json
+import logging
+import threading
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import ElementClickInterceptedException
+
+BY = {
+    "xpath": By.XPATH,
+    "css": By.CSS_SELECTOR,
+    "id": By.ID,
+}
+
+
+class LocatorRegistry:
+    """Registry of page element locators with usage statistics."""
+
+    def __init__(self, config_path, stats_path):
+        """Initialize registry from config and saved statistics."""
+        with open(config_path, "r", encoding="utf-8") as file:
+            self.locators = json.load(file)
+
+        self.stats_path = stats_path
+        self._lock = threading.Lock()
+        try:
+            with open(stats_path, "r", encoding="utf-8") as file:
+                self.stats = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.stats = {}
+
+    def value(self, name):
+        """Get the first configured value of locator `name`."""
+        return self.locators[name][0][1]
+
+    def group(self, prefix, by=None):
+        """Get {suffix: value} of the locators starting with `prefix.`.
+
+        With `by`, the value of their first `by` strategy. Locators without
+        one are left out.
+        """
+        prefix += "."
+        group = {}
+        for name, strategies in self.locators.items():
+            if not name.startswith(prefix):
+                continue
+            values = [v for kind, v in strategies if by in (None, kind)]
+            if values:
+                group[name[len(prefix) :]] = values[0]
+        return group
+
+    def _stats(self, name, value):
+        """Get statistics of a locator strategy."""
+        return self.stats.setdefault(name, {}).setdefault(
+            value, {"hits": 0, "misses": 0, "time": 0.0, "last_hit": 0}
+        )
+
+    def strategies(self, name):
+        """Get the strategies of `name`, most promising first."""
+
+        def rank(strategy):
+            stats = self._stats(name, strategy[1])
+            tries = stats["hits"] + stats["misses"]
+            rate = stats["hits"] / tries if tries else 0.5
+            return (-stats["last_hit"], -rate)
+
+        with self._lock:
+            return sorted(self.locators[name], key=rank)
+
+    def _record(self, name, value, hit, start):
+        """Record a strategy attempt."""
+        with self._lock:
+            stats = self._stats(name, value)
+            stats["time"] += time.perf_counter() - start
+            if hit:
+                stats["hits"] += 1
+                stats["last_hit"] = time.time()
+            else:
+                stats["misses"] += 1
+        if not hit:
+            logging.info("Locator %s missed with %s", name, value)
+
+    def find(self, driver, name):
+        """Find the element `name`, trying each strategy."""
+        for by, value in self.strategies(name):
+            start = time.perf_counter()
+            try:
+                element = driver.find_element(BY[by], value)
+            except NoSuchElementException:
+                self._record(name, value, False, start)
+                continue
+            self._record(name, value, True, start)
+            return element
+        raise NoSuchElementException(f"No locator found {name}")
+
+    def find_all(self, driver, name):
+        """Find all elements `name` with the first strategy finding any."""
+        for by, value in self.strategies(name):
+            start = time.perf_counter()
+            elements = driver.find_elements(BY[by], value)
+            self._record(name, value, bool(elements), start)
+            if elements:
+                return elements
+        return []
+
+    def click(self, driver, name):
+        """Click the element `name`, trying each strategy.
+
+        Raise the last error if none worked.
+        """
+        error = None
+        for by, value in self.strategies(name):
+            start = time.perf_counter()
+            try:
+                driver.find_element(BY[by], value).click()
+            except (
+                NoSuchElementException,
+                ElementClickInterceptedException,
+            ) as e:
+                self._record(name, value, False, start)
+                error = e
+                continue
+            self._record(name, value, True, start)
+            return
+        if error is None:
+            raise NoSuchElementException(f"No locator found {name}")
+        raise error
+
+    def save(self):
+        """Save statistics."""
+        tmp_path = self.stats_path + ".tmp"
+        with self._lock, open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.stats, file, indent=1)
+        os.replace(tmp_path, self.stats_path)
@@ -0,0 +1,128 @@
+# File: mediris
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Mediris data client over the JSON (XHR) endpoints the web app uses.
+# Reuses the browser's session cookies. Endpoints and JSON field names are
+# configured in mediris_api.json, check them against the browser's network
+# tab when Mediris changes. Field names may be dotted paths ("a.b").
+# -----------------------
+import json
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from validation import NON_DIGITS
+
+
+class MedirisError(Exception):
+    """Error when talking to the Mediris API."""
+
+
+def pick(data, path):
+    """Get a dotted `path` value out of JSON `data`, "" if missing."""
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return ""
+        data = data[key]
+    return "" if data is None else data
+
+
+class MedirisClient:
+    """Mediris JSON API client."""
+
+    def __init__(self, config_path, base_url=None, pool_size=4):
+        """Initialize client from config. `base_url` overrides it."""
+        with open(config_path, "r", encoding="utf-8") as file:
+            config = json.load(file)
+        self.base_url = (base_url or config["base_url"]).rstrip("/")
+        self.endpoints = config["endpoints"]
+        self.fields = config["fields"]
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Look like the web app's own requests.
+        self.session.headers.update(
+            {
+                "Accept": "application/json",
+                "X-Requested-With": "XMLHttpRequest",
+            }
+        )
+
+    def load_cookies(self, cookies):
+        """Reuse a browser session. `cookies` as from `get_cookies()`.
+
+        The cookie jar is swapped whole, requests running in other threads
+        keep the jar they started with.
+        """
+        jar = requests.cookies.RequestsCookieJar()
+        for cookie in cookies:
+            jar.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+            )
+        self.session.cookies = jar
+
+    def _get(self, endpoint, **params):
+        """Get the JSON of an endpoint."""
+        url = self.base_url + self.endpoints[endpoint].format(**params)
+        response = self.session.get(url, allow_redirects=False)
+        # Expired sessions get redirected to the login page.
+        if response.status_code in (301, 302, 303, 401, 403):
+            raise MedirisError("Mediris session expired")
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError:
+            raise MedirisError(f"Mediris {endpoint} did not answer JSON")
+
+    def waiting_room(self):
+        """Get the national numbers of the waiting patients."""
+        patients = self._get("waiting_room")
+        return [
+            NON_DIGITS.sub(
+                "", str(pick(patient, self.fields["national_number"]))
+            )
+            for patient in patients
+        ]
+
+    def patient(self, national_number):
+        """Get phone, email and GP name of a patient, None if not found."""
+        national_number = NON_DIGITS.sub("", str(national_number))
+        found = self._get("patient_search", national_number=national_number)
+        if not isinstance(found, list):
+            found = [found] if found else []
+        # The search may be loose, only take the patient asked for.
+        for patient in found:
+            number = pick(patient, self.fields["national_number"])
+            if NON_DIGITS.sub("", str(number)) == national_number:
+                break
+        else:
+            return None
+
+        data = {
+            "phone": str(pick(patient, self.fields["phone"])),
+            "email": str(pick(patient, self.fields["email"])),
+            "doctor": "",
+        }
+        try:
+            doctor = self._get(
+                "general_practitioner", id=pick(patient, self.fields["id"])
+            )
+        except requests.HTTPError as e:
+            # No GP.
+            logging.info("No Mediris GP: %s", e)
+        else:
+            if doctor:
+                data["doctor"] = str(pick(doctor, self.fields["doctor"]))
+        return data
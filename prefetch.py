@@ -0,0 +1,215 @@
+# File: prefetch
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Background Mediris waiting-room prefetcher.
+# Every waiting patient's contact data and GP are read into a cache keyed
+# by national number, and the GP's INAMI search is warmed once. The INAMI
+# cache must keep it for as long as the patient is cached, PATIENT_TTL.
+# Waiting room rows showing a cached national number are not opened.
+# Uses the Mediris JSON client if given. Otherwise runs its own browser
+# session (WebDriver sessions are not thread safe), logged in with the
+# desk's Mediris cookies, and reads values with `get_attribute`, never
+# through the clipboard.
+# -----------------------
+import re
+import time
+import logging
+import threading
+
+import requests
+from selenium.common.exceptions import WebDriverException
+
+from inami import decompose_doctor_name
+from mediris import MedirisError
+from validation import NON_DIGITS
+
+# National number as shown in the waiting room, e.g. 85.07.30-033.28.
+NATIONAL_NUMBER = re.compile(r"\b\d{2}\.?\d{2}\.?\d{2}-?\d{3}\.?\d{2}\b")
+# Prefetched patient data lifetime, in seconds.
+PATIENT_TTL = 3600
+
+
+class WaitingRoomPrefetcher(threading.Thread):
+    """Prefetch waiting patients' Mediris data."""
+
+    def __init__(
+        self,
+        start_driver,
+        cookies,
+        url,
+        locators,
+        inami_client=None,
+        interval=30,
+        ttl=PATIENT_TTL,
+        client=None,
+    ):
+        """Initialize prefetcher.
+
+        `start_driver` starts a new driver, `cookies` are the Mediris
+        session cookies and `url` the waiting room page. With a Mediris
+        `client`, no browser is used.
+        """
+        super(WaitingRoomPrefetcher, self).__init__(
+            name="prefetch", daemon=True
+        )
+        self.start_driver = start_driver
+        self.cookies = cookies
+        self.url = url
+        self.locators = locators
+        self.inami_client = inami_client
+        self.interval = interval
+        self.ttl = ttl
+        self.client = client
+
+        self.driver = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def get(self, national_number):
+        """Get prefetched data of a patient, None if unknown or too old."""
+        key = NON_DIGITS.sub("", str(national_number))
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is None or entry[0] + self.ttl < time.monotonic():
+            return None
+        return dict(entry[1])
+
+    def stop(self):
+        """Stop prefetching."""
+        self._stop_event.set()
+
+    def run(self):
+        """Scan the waiting room until stopped."""
+        if self.client is not None:
+            while not self._stop_event.is_set():
+                try:
+                    self._scan_client()
+                except (MedirisError, requests.RequestException) as e:
+                    logging.warning("Prefetch scan failed: %s", e)
+                self._stop_event.wait(self.interval)
+            return
+
+        try:
+            self.driver = self.start_driver()
+            # Cookies can only be set on the page's domain.
+            self.driver.get(self.url)
+            for cookie in self.cookies:
+                try:
+                    self.driver.add_cookie(cookie)
+                except WebDriverException:
+                    continue
+
+            while not self._stop_event.is_set():
+                try:
+                    self._scan()
+                except WebDriverException as e:
+                    logging.warning("Prefetch scan failed: %s", e)
+                self._stop_event.wait(self.interval)
+        finally:
+            if self.driver is not None:
+                try:
+                    self.driver.quit()
+                except WebDriverException:
+                    pass
+
+    def _value(self, name):
+        """Read an input's value."""
+        element = self.locators.find(self.driver, name)
+        return element.get_attribute("value") or ""
+
+    def _scan(self):
+        """Read every patient of the waiting room."""
+        self.driver.get(self.url)
+        if self.driver.find_elements_by_xpath(
+            self.locators.value("login.username")
+        ):
+            logging.warning("Prefetch session logged out, stopping")
+            self.stop()
+            return
+
+        keys = [
+            self._row_key(row)
+            for row in self.locators.find_all(
+                self.driver, "mediris.waiting_room_patient"
+            )
+        ]
+        logging.info("Prefetch: %s waiting patients", len(keys))
+        for i, key in enumerate(keys):
+            if self._stop_event.is_set():
+                return
+            if key and self.get(key) is not None:
+                continue
+            # Rows go stale when leaving the page, find them again.
+            self.driver.get(self.url)
+            rows = self.locators.find_all(
+                self.driver, "mediris.waiting_room_patient"
+            )
+            if i >= len(rows):
+                return
+            rows[i].click()
+            self._read_patient()
+
+    def _scan_client(self):
+        """Read every patient of the waiting room over the JSON API."""
+        national_numbers = self.client.waiting_room()
+        logging.info("Prefetch: %s waiting patients", len(national_numbers))
+        for key in national_numbers:
+            if self._stop_event.is_set():
+                return
+            if not key:
+                continue
+            if self.get(key) is not None:
+                continue
+            data = self.client.patient(key)
+            if data is not None:
+                self._store(key, data)
+
+    @staticmethod
+    def _row_key(row):
+        """Get the national number shown in a waiting room row, or ""."""
+        match = NATIONAL_NUMBER.search(row.text)
+        return NON_DIGITS.sub("", match.group()) if match else ""
+
+    def _read_patient(self):
+        """Read the open patient, unless still cached."""
+        self.locators.click(self.driver, "mediris.patient_tab")
+        key = NON_DIGITS.sub("", self._value("mediris.national_number"))
+        if not key or self.get(key) is not None:
+            return
+
+        data = {
+            "phone": self._value("mediris.phone"),
+            "email": self._value("mediris.email"),
+            "doctor": "",
+        }
+        try:
+            self.locators.click(self.driver, "mediris.doctor_tab")
+            data["doctor"] = self.locators.find(
+                self.driver, "mediris.doctor_name"
+            ).text
+        except WebDriverException:
+            # No GP selected.
+            pass
+
+        self._store(key, data)
+
+    def _store(self, key, data):
+        """Cache a patient's data and warm its GP search."""
+        with self._lock:
+            self._cache[key] = (time.monotonic(), data)
+        logging.info("Prefetched patient, GP: %s", data["doctor"])
+        if not data["doctor"] or self.inami_client is None:
+            return
+
+        # Same query as the desk will make.
+        try:
+            self.inami_client.search(decompose_doctor_name(data["doctor"]))
+        except Exception as e:
+            logging.warning("Prefetch INAMI search failed: %s", e)
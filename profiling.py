@@ -0,0 +1,171 @@
+# File: profiling
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Per-patient stage timing and opt-in profiling.
+# Stage timings always go to the `timing` log. Profiles use cProfile, or
+# pyinstrument if installed and asked for. Both hook the profile function,
+# so only one of them can run at a time.
+# -----------------------
+import os
+import time
+import pstats
+import logging
+import cProfile
+
+try:
+    import pyinstrument
+    from pyinstrument.session import Session
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+except ImportError:
+    pyinstrument = None
+
+timing_log = logging.getLogger("timing")
+
+
+class PatientProfiler:
+    """Time and optionally profile each patient and its sections."""
+
+    def __init__(self, directory, profiler=None, sections=False):
+        """Initialize profiler.
+
+        `profiler` is None (timing only), "cprofile" or "pyinstrument".
+        With `sections`, a profile is also written for every section.
+        """
+        if profiler == "pyinstrument" and pyinstrument is None:
+            logging.warning("pyinstrument not installed, using cProfile")
+            profiler = "cprofile"
+        self.profiler = profiler
+        self.sections = sections
+        self.directory = directory
+        if profiler is not None and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.patient = 0
+        self._patient_start = None
+        self._section = None
+        self._section_start = None
+        self._profile = None
+        self._profiles = []
+        self._files = []
+        self._sessions = []
+
+    def start_patient(self):
+        """Start timing a new patient."""
+        if self._patient_start is not None:
+            # Previous patient was never stopped.
+            self.skip_patient()
+        self.patient += 1
+        self._patient_start = time.perf_counter()
+        self._profiles = []
+
+    def section(self, name):
+        """End the current section and start section `name`."""
+        self._end_section()
+        self._section = name
+        self._section_start = time.perf_counter()
+        if self.profiler == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.profiler == "pyinstrument":
+            self._profile = pyinstrument.Profiler()
+            self._profile.start()
+
+    def _end_section(self):
+        """Stop and log the current section."""
+        if self._section is None:
+            return
+        if self.profiler == "cprofile":
+            self._profile.disable()
+        elif self.profiler == "pyinstrument":
+            self._profile.stop()
+        if self._profile is not None:
+            self._profiles.append((self._section, self._profile))
+
+        timing_log.info(
+            "Patient %s: %s took %.3fs",
+            self.patient,
+            self._section,
+            time.perf_counter() - self._section_start,
+        )
+        self._section = None
+        self._profile = None
+
+    def stop_patient(self):
+        """End the patient and write its profiles."""
+        self._end_section()
+        timing_log.info(
+            "Patient %s: total %.3fs",
+            self.patient,
+            time.perf_counter() - self._patient_start,
+        )
+        self._patient_start = None
+        if not self._profiles:
+            return
+
+        path = os.path.join(self.directory, "patient-%04d" % self.patient)
+        if self.profiler == "cprofile":
+            stats = pstats.Stats(self._profiles[0][1])
+            for name, profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path + ".pstats")
+            self._files.append(path + ".pstats")
+            if self.sections:
+                for name, profile in self._profiles:
+                    profile.dump_stats(f"{path}-{name}.pstats")
+
+        elif self.profiler == "pyinstrument":
+            session = self._profiles[0][1].last_session
+            for name, profile in self._profiles[1:]:
+                session = Session.combine(session, profile.last_session)
+            self._write_session(session, path)
+            self._sessions.append(session)
+            if self.sections:
+                for name, profile in self._profiles:
+                    self._write_session(profile.last_session, f"{path}-{name}")
+
+        self._profiles = []
+
+    def skip_patient(self):
+        """Discard the current patient, its number is used again."""
+        if self.profiler == "cprofile" and self._profile is not None:
+            self._profile.disable()
+        elif self.profiler == "pyinstrument" and self._profile is not None:
+            self._profile.stop()
+        timing_log.info("Patient %s: skipped", self.patient)
+        self.patient -= 1
+        self._patient_start = None
+        self._section = None
+        self._profile = None
+        self._profiles = []
+
+    @staticmethod
+    def _write_session(session, path):
+        """Write a pyinstrument session as HTML and speedscope files."""
+        with open(path + ".html", "w", encoding="utf-8") as file:
+            file.write(HTMLRenderer().render(session))
+        with open(path + ".speedscope.json", "w", encoding="utf-8") as file:
+            file.write(SpeedscopeRenderer().render(session))
+
+    def close(self):
+        """Discard any unfinished patient and write the merged profile."""
+        if self._section is not None:
+            self._end_section()
+        self._profiles = []
+
+        path = os.path.join(self.directory, "merged")
+        if self._files:
+            pstats.Stats(*self._files).dump_stats(path + ".pstats")
+        elif self._sessions:
+            session = self._sessions[0]
+            for other in self._sessions[1:]:
+                session = Session.combine(session, other)
+            self._write_session(session, path)
+        else:
+            return
+        logging.info("Merged profile written to %s", path)
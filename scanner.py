@@ -0,0 +1,128 @@
+# File: scanner
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Type-ahead operator input.
+# A thread reads every stdin line (keyboard or keyboard-wedge barcode
+# scanner) as soon as it comes in. Tube codes are kept apart, so a tube
+# scanned early waits for the tube prompt instead of answering another one,
+# where the operator confirms it.
+# WARNING: Once started, nothing else may read stdin (no `input()`).
+# -----------------------
+import re
+import sys
+import logging
+import threading
+import collections
+
+# Test tube codes: C19...M
+TUBE = re.compile(r"^C19\S*M$", re.IGNORECASE)
+COMMANDS = ("q", "quit", "e", "exit")
+
+InputEvent = collections.namedtuple("InputEvent", ("kind", "value"))
+
+
+def classify(line):
+    """Make an input event of a line: tube, command or text."""
+    line = line.strip()
+    if TUBE.match(line):
+        return InputEvent("tube", line.upper())
+    if line.lower() in COMMANDS:
+        return InputEvent("command", line.lower())
+    return InputEvent("text", line)
+
+
+def next_tube(code):
+    """Predict the tube code following `code`, keeping zero padding."""
+    parts = code.split("-")
+    for i, part in enumerate(parts):
+        if part.isdigit():
+            parts[i] = str(int(part) + 1).zfill(len(part))
+            return "-".join(parts)
+    return code
+
+
+class InputQueue:
+    """Queue of operator input events."""
+
+    def __init__(self, stream=None):
+        """Initialize queue reading `stream`, stdin by default."""
+        self.stream = stream if stream is not None else sys.stdin
+        self._tubes = collections.deque()
+        self._lines = collections.deque()
+        self._eof = False
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="scanner", daemon=True
+        )
+
+    def start(self):
+        """Start reading input."""
+        self._thread.start()
+
+    def _run(self):
+        """Read and queue lines until end of input."""
+        for line in iter(self.stream.readline, ""):
+            event = classify(line)
+            logging.info("Input event: %s", event.kind)
+            with self._ready:
+                if event.kind == "tube":
+                    self._tubes.append(event)
+                else:
+                    self._lines.append(event)
+                self._ready.notify_all()
+        with self._ready:
+            self._eof = True
+            self._ready.notify_all()
+
+    def _wait(self, queues):
+        """Wait for and pop the first event of the first non-empty queue."""
+        with self._ready:
+            while True:
+                for events in queues:
+                    if events:
+                        return events.popleft()
+                if self._eof:
+                    raise EOFError()
+                # Timeout so Ctrl+C still gets through on Windows.
+                self._ready.wait(0.5)
+
+    def next_event(self, text=""):
+        """Show `text` and get the next non-tube event."""
+        print(text, end="", flush=True)
+        return self._wait((self._lines,))
+
+    def prompt(self, text=""):
+        """Show `text` and get the next non-tube line, like `input`."""
+        return self.next_event(text).value
+
+    def prompt_tube(self, text=""):
+        """Show `text` and get a tube code, scanned early or not.
+
+        A typed line is returned too (e.g. empty to accept a prediction).
+        """
+        with self._ready:
+            early = bool(self._tubes)
+        print(text, end="", flush=True)
+        event = self._wait((self._tubes, self._lines))
+        if early and event.kind == "tube":
+            # Show what was scanned ahead, it was not echoed here. It may
+            # have been meant for an earlier patient.
+            print(event.value)
+            check_in = self.prompt("Use this early scanned tube? [yes/no] ")
+            if not check_in.lower().startswith("y"):
+                logging.info("Early scanned tube refused")
+                return self.prompt_tube(text)
+        return event.value
+
+    def clear_tubes(self):
+        """Drop tube codes scanned early, e.g. for an abandoned patient."""
+        with self._ready:
+            if self._tubes:
+                logging.info("Dropping %s early tubes", len(self._tubes))
+            self._tubes.clear()
@@ -0,0 +1,82 @@
+# File: sessions
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Per-site browser cookie store, so logins survive restarts.
+# WARNING: Session files give access to the sites, keep them private.
+# -----------------------
+import os
+import time
+import json
+import logging
+
+from selenium.common.exceptions import WebDriverException
+
+# Drivers' implicit wait in seconds.
+IMPLICIT_WAIT = 3
+
+
+def has_element(driver, xpath, wait=1):
+    """Check if an element exists, waiting at most `wait` seconds."""
+    driver.implicitly_wait(wait)
+    try:
+        return bool(driver.find_elements_by_xpath(xpath))
+    finally:
+        driver.implicitly_wait(IMPLICIT_WAIT)
+
+
+class CookieStore:
+    """Store browser cookies per site between runs."""
+
+    def __init__(self, directory):
+        """Initialize store in `directory`."""
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def path(self, site):
+        """Get session file path of `site`."""
+        return os.path.join(self.directory, site + ".json")
+
+    def save(self, site, driver):
+        """Save the current cookies of `driver` for `site`."""
+        logging.info("Saving %s session", site)
+        with open(self.path(site), "w", encoding="utf-8") as file:
+            json.dump(driver.get_cookies(), file)
+
+    def restore(self, site, driver, url):
+        """Open `url` with the saved cookies of `site`.
+
+        Return False if there is no saved session.
+        """
+        try:
+            with open(self.path(site), "r", encoding="utf-8") as file:
+                cookies = json.load(file)
+        except (FileNotFoundError, ValueError):
+            logging.info("No saved %s session", site)
+            return False
+
+        # Cookies can only be set on the page's domain.
+        driver.get(url)
+        now = time.time()
+        restored = 0
+        for cookie in cookies:
+            if cookie.get("expiry", now + 1) <= now:
+                continue
+            try:
+                driver.add_cookie(cookie)
+            except WebDriverException:
+                # Other domain (e.g. login redirect), skip.
+                continue
+            restored += 1
+
+        logging.info("Restored %s %s cookies", restored, site)
+        if not restored:
+            return False
+        driver.get(url)
+        return True
@@ -0,0 +1,244 @@
+# File: supervisor
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Runs several desks on one workstation.
+# Each desk is a covrecord.py worker in its own console, with its own eID
+# directory, log, journal, locator statistics and browser sessions. The
+# supervisor runs the auto-update once, then serves the workers one INAMI
+# search client (one doctor cache, one HTTP connection pool) and
+# coordinates test tube codes. Aggregate throughput is read from the
+# shared registration ledger.
+# Desks are stopped with their browsers (geckodriver and Firefox).
+# Usage: python supervisor.py --desks 2 [covrecord.py options]
+# -----------------------
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+from multiprocessing.managers import BaseManager
+
+import cassette
+from inami import InamiSearchClient
+from ledger import Ledger
+from prefetch import PATIENT_TTL
+from scanner import next_tube
+
+WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+COVRECORD_PATH = os.path.join(WORK_DIR, "covrecord.py")
+LEDGER_PATH = os.path.join(WORK_DIR, "covrecord.ledger")
+# Workers find the supervisor's authentication key here.
+KEY_ENV = "COVRECORD_SUPERVISOR_KEY"
+
+
+class TubeAllocator:
+    """Test tube codes claimed by the desks."""
+
+    def __init__(self):
+        """Initialize allocator."""
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def claim(self, code, desk):
+        """Claim `code` for `desk`. False if another desk has it."""
+        with self._lock:
+            owner = self._claims.setdefault(code.upper(), desk)
+        if owner != desk:
+            logging.warning("Desk %s tube %s taken by %s", desk, code, owner)
+        return owner == desk
+
+    def next_free(self, code):
+        """Get `code`, or the next code no desk has claimed."""
+        with self._lock:
+            while code and code.upper() in self._claims:
+                following = next_tube(code)
+                if following == code:
+                    break
+                code = following
+        return code
+
+
+# Shared objects, created in the manager's server process.
+_inami_client = None
+_tube_allocator = None
+
+
+def _get_inami_client():
+    """Get the shared INAMI search client."""
+    global _inami_client
+    if _inami_client is None:
+        # Keeps prefetched GP searches as long as their patients.
+        _inami_client = InamiSearchClient(
+            ttl=PATIENT_TTL, session=cassette.session()
+        )
+    return _inami_client
+
+
+def _get_tube_allocator():
+    """Get the shared test tube allocator."""
+    global _tube_allocator
+    if _tube_allocator is None:
+        _tube_allocator = TubeAllocator()
+    return _tube_allocator
+
+
+class DeskManager(BaseManager):
+    """Manager serving the shared desk objects."""
+
+
+DeskManager.register("inami", callable=_get_inami_client)
+DeskManager.register("tubes", callable=_get_tube_allocator)
+
+
+def connect(address):
+    """Connect a worker to the supervisor at "host:port"."""
+    host, port = address.rsplit(":", 1)
+    manager = DeskManager(
+        address=(host, int(port)),
+        authkey=bytes.fromhex(os.environ[KEY_ENV]),
+    )
+    manager.connect()
+    return manager
+
+
+def start_desk(desk, address, options):
+    """Start a covrecord.py worker for `desk`."""
+    eid_dir = os.path.join(os.path.expandvars("%TMP%"), "eid-" + desk)
+    command = [
+        sys.executable,
+        COVRECORD_PATH,
+        "--desk",
+        desk,
+        "--eid-dir",
+        eid_dir,
+        "--supervisor",
+        address,
+    ] + options
+    logging.info("Starting desk %s: %s", desk, command)
+    # Each desk reads its own keyboard input in its own console. On POSIX,
+    # in its own process group to stop it with its browsers.
+    return subprocess.Popen(
+        command,
+        cwd=WORK_DIR,
+        creationflags=getattr(subprocess, "CREATE_NEW_CONSOLE", 0),
+        start_new_session=os.name != "nt",
+    )
+
+
+def stop_desk(worker):
+    """Stop a desk and its browsers."""
+    if worker.poll() is not None:
+        return
+    if os.name == "nt":
+        # Kill the whole process tree: Python, geckodriver and Firefox.
+        subprocess.call(
+            ["taskkill", "/T", "/F", "/PID", str(worker.pid)],
+            stdout=subprocess.DEVNULL,
+        )
+    else:
+        os.killpg(worker.pid, signal.SIGTERM)
+
+
+def print_throughput(ledger, desks):
+    """Print today's tests per desk and in total."""
+    counts = dict.fromkeys(desks, 0)
+    last_hour = time.strftime("%H")
+    hour_count = 0
+    for day, hour, desk, count in ledger.throughput():
+        if desk in counts:
+            counts[desk] += count
+            if hour == last_hour:
+                hour_count += count
+
+    print(time.strftime("%H:%M"), end="\t")
+    for desk, count in counts.items():
+        print(f"{desk}: {count}", end="\t")
+    print(f"Total: {sum(counts.values())}\tThis hour: {hour_count}")
+
+
+def main():
+    """Run the desks until they all quit."""
+    parser = argparse.ArgumentParser(
+        description="Run several CovRecord desks on one workstation.",
+    )
+    parser.add_argument(
+        "--desks",
+        type=int,
+        default=2,
+        help="Number of desks to run.",
+    )
+    parser.add_argument(
+        "--name",
+        default=platform.node(),
+        help="Desk name prefix, desks are named <name>-1, <name>-2...",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=60,
+        help="Seconds between throughput reports.",
+    )
+    parser.add_argument(
+        "--cassette",
+        choices=cassette.MODES,
+        help="Record or replay SilverPages and GitHub HTTP traffic.",
+    )
+    args, options = parser.parse_known_args()
+
+    logging.basicConfig(
+        filename=os.path.join(WORK_DIR, "supervisor.py.log"),
+        level=logging.INFO,
+        format="At %(asctime)s: %(name)s - %(levelname)s: %(message)s",
+        filemode="w",
+        datefmt="%d/%m/%Y %I:%M:%S %p",
+        encoding="UTF-8",
+    )
+
+    # The shared INAMI client, the update and the desks read the cassette
+    # mode from the environment.
+    if args.cassette:
+        os.environ["COVRECORD_CASSETTE"] = args.cassette
+
+    # Update once, before any desk runs the files.
+    print("Checking for updates...")
+    subprocess.call([sys.executable, COVRECORD_PATH, "update"], cwd=WORK_DIR)
+
+    # Workers are on this machine only.
+    authkey = os.urandom(16)
+    os.environ[KEY_ENV] = authkey.hex()
+    manager = DeskManager(address=("127.0.0.1", 0), authkey=authkey)
+    manager.start()
+    address = "%s:%s" % manager.address
+    logging.info("Supervisor serving at %s", address)
+
+    desks = [f"{args.name}-{i}" for i in range(1, args.desks + 1)]
+    workers = {desk: start_desk(desk, address, options) for desk in desks}
+    ledger = Ledger(LEDGER_PATH)
+    try:
+        while any(worker.poll() is None for worker in workers.values()):
+            print_throughput(ledger, desks)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Stopping desks...")
+        for worker in workers.values():
+            stop_desk(worker)
+    finally:
+        for desk, worker in workers.items():
+            logging.info("Desk %s exited: %s", desk, worker.wait())
+        print_throughput(ledger, desks)
+        ledger.close()
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+# Modules are run from the work directory, not installed.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import standin  # noqa: E402
+
+
+@pytest.fixture
+def covrecord_site():
+    """Run a CovRecord stand-in."""
+    site = standin.covrecord()
+    yield site
+    site.stop()
+
+
+@pytest.fixture
+def mediris_site():
+    """Run a Mediris stand-in with two waiting patients."""
+    site = standin.mediris(
+        [
+            {
+                "id": 1,
+                "rijksregisternummer": "85.07.30-033.28",
+                "telefoonnummer": "0470 12 34 56",
+                "email": "jan@example.be",
+                "huisarts": "Dr. Marie Dupont",
+            },
+            {
+                "id": 2,
+                "rijksregisternummer": "90.02.01-997.04",
+                "telefoonnummer": None,
+                "email": "",
+            },
+        ]
+    )
+    yield site
+    site.stop()
+
+
+@pytest.fixture
+def echo_site():
+    """Run a generic echo stand-in."""
+    site = standin.echo()
+    yield site
+    site.stop()
@@ -0,0 +1,249 @@
+# File: standin
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Local stand-in servers for the sites the desk talks to over HTTP.
+# They only mimic what the clients rely on: page markup, field ids,
+# sessions and error answers.
+# -----------------------
+import os
+import json
+import time
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from locators import LocatorRegistry
+
+LOCATORS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "locators.json",
+)
+
+SESSION = "standin-session"
+CSRF = "standin-csrf"
+
+
+def covrecord_fields():
+    """Get {record key: form field id} from locators.json."""
+    # No statistics, they are only read.
+    registry = LocatorRegistry(LOCATORS_PATH, os.devnull)
+    return registry.group("covrecord.field", "id")
+
+
+class StandIn:
+    """A stand-in server running in a thread."""
+
+    def __init__(self, handler):
+        """Initialize server with a request `handler` class."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.standin = self
+        self.requests = []
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self):
+        """Get the server base URL."""
+        return "http://%s:%s" % self.server.server_address
+
+    def start(self):
+        """Start serving."""
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Stand-in request handler base."""
+
+    def log_message(self, format, *args):
+        """Keep test output quiet."""
+
+    @property
+    def standin(self):
+        """Get the stand-in this request is for."""
+        return self.server.standin
+
+    def logged_in(self):
+        """Check the session cookie."""
+        return SESSION in self.headers.get("Cookie", "")
+
+    def read_form(self):
+        """Read an urlencoded body as {name: value}."""
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        return {k: v[0] for k, v in parse_qs(body).items()}
+
+    def answer(self, body, status=200, content_type="text/html", headers=()):
+        """Send an answer."""
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CovRecordHandler(Handler):
+    """CovRecord stand-in: login and registration form."""
+
+    def do_GET(self):
+        """Serve the login page or an empty form."""
+        if not self.logged_in():
+            self.answer(login_page())
+        else:
+            self.answer(registration_page({}))
+
+    def do_POST(self):
+        """Login or register."""
+        data = self.read_form()
+        self.standin.requests.append(data)
+        if "user" in data:
+            if data["pass"] != "secret":
+                self.answer(login_page())
+                return
+            self.answer(
+                registration_page({}),
+                headers=[("Set-Cookie", f"{SESSION}=1; Path=/")],
+            )
+        elif not self.logged_in():
+            self.answer(login_page())
+        elif data.get("csrf") != CSRF or not data.get("f-numberEcouvillon"):
+            # Refused, the form comes back filled in with an error.
+            self.answer(registration_page(data, "Missing test tube"))
+        else:
+            self.standin.registrations.append(data)
+            # Slow answer, saved all the same.
+            time.sleep(self.standin.delay)
+            self.answer(registration_page({}))
+
+
+def login_page():
+    """Build the login page."""
+    return (
+        '<form method="post" action="index.php">'
+        '<input id="username" name="user">'
+        '<input id="password" name="pass" type="password">'
+        "</form>"
+    )
+
+
+def registration_page(data, error=None):
+    """Build the registration page, with `data` filled in."""
+    inputs = "".join(
+        f'<input id="{field}" name="f-{field}" '
+        f'value="{data.get("f-" + field, "")}">'
+        for field in covrecord_fields().values()
+    )
+    alert = f'<div class="alert-danger">{error}</div>' if error else ""
+    return (
+        f'{alert}<form method="post" action="index.php">'
+        f'<input type="hidden" name="csrf" value="{CSRF}">{inputs}'
+        '<button class="btn btn-primary">Print</button>'
+        '<button class="btn" name="save" value="1">Save</button>'
+        "</form>"
+    )
+
+
+def covrecord():
+    """Start a CovRecord stand-in."""
+    standin = StandIn(CovRecordHandler)
+    standin.registrations = []
+    standin.delay = 0
+    return standin.start()
+
+
+class MedirisHandler(Handler):
+    """Mediris stand-in: the JSON endpoints of mediris_api.json."""
+
+    def do_GET(self):
+        """Answer JSON, or redirect to login without session."""
+        url = urlparse(self.path)
+        self.standin.requests.append(url)
+        if not self.logged_in():
+            self.answer("", status=302, headers=[("Location", "/login")])
+            return
+
+        parts = url.path.strip("/").split("/")
+        patients = self.standin.patients
+        if url.path == "/api/wachtzaal":
+            self.json(
+                [
+                    {"rijksregisternummer": p["rijksregisternummer"]}
+                    for p in patients
+                ]
+            )
+        elif url.path == "/api/patient":
+            wanted = parse_qs(url.query)["rijksregisternummer"][0]
+            if self.standin.loose:
+                # Every patient, the wanted one last.
+                self.json(sorted(patients, key=lambda p: digits(p) == wanted))
+            else:
+                self.json([p for p in patients if digits(p) == wanted])
+        elif parts[:2] == ["api", "patient"] and parts[3:] == ["huisarts"]:
+            found = [p for p in patients if str(p["id"]) == parts[2]]
+            if not found or not found[0].get("huisarts"):
+                self.answer("", status=404)
+            else:
+                self.json({"naam": found[0]["huisarts"]})
+        else:
+            self.answer("", status=404)
+
+    def json(self, data):
+        """Answer JSON `data`."""
+        self.answer(json.dumps(data), content_type="application/json")
+
+
+def digits(patient):
+    """Get a stand-in patient's national number digits."""
+    return "".join(c for c in patient["rijksregisternummer"] if c.isdigit())
+
+
+def mediris(patients):
+    """Start a Mediris stand-in with `patients` waiting."""
+    standin = StandIn(MedirisHandler)
+    standin.patients = patients
+    standin.loose = False
+    return standin.start()
+
+
+class EchoHandler(Handler):
+    """Generic stand-in: echoes the request, errors under /error."""
+
+    def do_GET(self):
+        """Answer the method, path and a request count."""
+        self.echo("")
+
+    def do_POST(self):
+        """Answer the method, path, body and a request count."""
+        length = int(self.headers.get("Content-Length", 0))
+        self.echo(self.rfile.read(length).decode("utf-8"))
+
+    def echo(self, body):
+        """Answer the request back, or an error under /error."""
+        self.standin.requests.append(self.path)
+        status = 500 if self.path.startswith("/error") else 200
+        count = len(self.standin.requests)
+        self.answer(
+            f"{self.command} {self.path} {body} #{count}",
+            status=status,
+            content_type="text/plain; charset=utf-8",
+        )
+
+
+def echo():
+    """Start a generic echo stand-in."""
+    return StandIn(EchoHandler).start()
@@ -0,0 +1,83 @@
+import pytest
+import requests
+
+import cassette
+from cassette import CassetteMiss, request_key
+
+
+def key(method, url, **kwargs):
+    return request_key(requests.Request(method, url, **kwargs).prepare())
+
+
+def test_key_ignores_query_order():
+    assert key("GET", "http://site/a?x=1&y=2") == key(
+        "GET", "http://site/a?y=2&x=1"
+    )
+    assert key("GET", "HTTP://SITE/a?x=1") == key("GET", "http://site/a?x=1")
+
+
+def test_key_depends_on_method_path_and_body():
+    assert key("GET", "http://site/a") != key("GET", "http://site/b")
+    assert key("GET", "http://site/a") != key("POST", "http://site/a")
+    assert key("POST", "http://site/a", data={"x": "1"}) == key(
+        "POST", "http://site/a", data={"x": "1"}
+    )
+    assert key("POST", "http://site/a", data={"x": "1"}) != key(
+        "POST", "http://site/a", data={"x": "2"}
+    )
+
+
+def test_key_depends_on_accept_header():
+    assert key("GET", "http://site/a", headers={"Accept": "text/html"}) != (
+        key("GET", "http://site/a", headers={"Accept": "application/json"})
+    )
+
+
+def test_record_then_replay(echo_site, tmp_path):
+    recorder = cassette.session(str(tmp_path), "record")
+    recorded = recorder.get(echo_site.url + "/a?x=1&y=2")
+    assert recorded.text == "GET /a?x=1&y=2  #1"
+
+    player = cassette.session(str(tmp_path), "replay")
+    replayed = player.get(echo_site.url + "/a?y=2&x=1")
+    assert replayed.status_code == 200
+    assert replayed.text == recorded.text
+    assert len(echo_site.requests) == 1
+
+
+def test_replay_posts_by_body(echo_site, tmp_path):
+    recorder = cassette.session(str(tmp_path), "record")
+    recorder.post(echo_site.url + "/form", data={"x": "1"})
+
+    player = cassette.session(str(tmp_path), "replay")
+    assert player.post(echo_site.url + "/form", data={"x": "1"}).ok
+    with pytest.raises(CassetteMiss):
+        player.post(echo_site.url + "/form", data={"x": "2"})
+    assert len(echo_site.requests) == 1
+
+
+def test_replay_miss_does_not_go_to_network(echo_site, tmp_path):
+    player = cassette.session(str(tmp_path), "replay")
+    with pytest.raises(CassetteMiss):
+        player.get(echo_site.url + "/a")
+    assert not echo_site.requests
+
+
+def test_record_missing_records_once(echo_site, tmp_path):
+    http_session = cassette.session(str(tmp_path), "record_missing")
+    first = http_session.get(echo_site.url + "/a")
+    second = http_session.get(echo_site.url + "/a")
+    assert second.text == first.text
+    assert len(echo_site.requests) == 1
+
+
+def test_errors_are_not_stored(echo_site, tmp_path):
+    http_session = cassette.session(str(tmp_path), "record_missing")
+    assert http_session.get(echo_site.url + "/error").status_code == 500
+    assert http_session.get(echo_site.url + "/error").status_code == 500
+    assert len(echo_site.requests) == 2
+    assert not list((tmp_path / "requests").iterdir())
+
+    player = cassette.session(str(tmp_path), "replay")
+    with pytest.raises(CassetteMiss):
+        player.get(echo_site.url + "/error")
@@ -0,0 +1,87 @@
+import pytest
+
+from covrecord_http import CovRecordClient, CovRecordError
+from covrecord_http import CovRecordUnconfirmed
+from standin import covrecord_fields
+
+FIELDS = {
+    "name": "nom",
+    "firstname": "prenom",
+    "test_tube": "numberEcouvillon",
+}
+RECORD = {"name": "Peeters", "firstname": "Jan", "test_tube": "C19-0001-M"}
+
+
+def logged_in_client(site):
+    client = CovRecordClient(site.url + "/index.php")
+    client.login("desk", "secret")
+    return client
+
+
+def test_submit_registers_with_form_defaults(covrecord_site):
+    client = logged_in_client(covrecord_site)
+    client.submit(RECORD, FIELDS, "button[name=save]")
+
+    (registration,) = covrecord_site.registrations
+    assert registration["f-nom"] == "Peeters"
+    assert registration["f-numberEcouvillon"] == "C19-0001-M"
+    assert registration["csrf"] == "standin-csrf"
+    assert registration["save"] == "1"
+
+
+def test_login_failure(covrecord_site):
+    client = CovRecordClient(covrecord_site.url + "/index.php")
+    with pytest.raises(CovRecordError):
+        client.login("desk", "wrong")
+
+
+def test_refused_form_is_not_confirmed(covrecord_site):
+    client = logged_in_client(covrecord_site)
+    with pytest.raises(CovRecordError, match="Missing test tube"):
+        client.submit(dict(RECORD, test_tube=""), FIELDS)
+    assert not covrecord_site.registrations
+
+
+def test_expired_session_logs_in_again(covrecord_site):
+    client = logged_in_client(covrecord_site)
+    client.session.cookies.clear()
+    client.submit(RECORD, FIELDS)
+    assert len(covrecord_site.registrations) == 1
+
+
+def test_expired_session_without_credentials(covrecord_site):
+    client = CovRecordClient(covrecord_site.url + "/index.php")
+    with pytest.raises(CovRecordError, match="expired"):
+        client.submit(RECORD, FIELDS)
+
+
+def test_submit_locator_fields(covrecord_site):
+    client = logged_in_client(covrecord_site)
+    client.submit(dict(RECORD, zip="1040"), covrecord_fields())
+
+    (registration,) = covrecord_site.registrations
+    assert registration["f-adresse"] == "1040"
+
+
+def test_error_after_sending_is_unconfirmed(covrecord_site):
+    client = logged_in_client(covrecord_site)
+    with pytest.raises(CovRecordUnconfirmed):
+        client.submit(dict(RECORD, test_tube=""), FIELDS)
+
+
+def test_error_before_sending_is_not_unconfirmed(covrecord_site):
+    client = CovRecordClient(covrecord_site.url + "/index.php")
+    with pytest.raises(CovRecordError) as error:
+        client.submit(RECORD, FIELDS)
+    assert not isinstance(error.value, CovRecordUnconfirmed)
+    assert not covrecord_site.registrations
+
+
+def test_read_timeout_is_unconfirmed(covrecord_site):
+    client = logged_in_client(covrecord_site)
+    client.timeout = 0.2
+    covrecord_site.delay = 0.5
+    with pytest.raises(CovRecordUnconfirmed):
+        client.submit(RECORD, FIELDS)
+    # Saved anyway.
+    assert len(covrecord_site.registrations) == 1
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from mediris import MedirisClient, MedirisError, pick
+from standin import SESSION
+
+CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "mediris_api.json",
+)
+
+
+def client_for(site, logged_in=True):
+    client = MedirisClient(CONFIG, base_url=site.url)
+    if logged_in:
+        client.load_cookies([{"name": SESSION, "value": "1"}])
+    return client
+
+
+def test_pick():
+    data = {"a": {"b": 1, "c": None}}
+    assert pick(data, "a.b") == 1
+    assert pick(data, "a.c") == ""
+    assert pick(data, "a.d") == ""
+    assert pick(data, "a.b.c") == ""
+
+
+def test_waiting_room(mediris_site):
+    client = client_for(mediris_site)
+    assert client.waiting_room() == ["85073003328", "90020199704"]
+
+
+def test_patient_with_gp(mediris_site):
+    client = client_for(mediris_site)
+    assert client.patient("85.07.30-033.28") == {
+        "phone": "0470 12 34 56",
+        "email": "jan@example.be",
+        "doctor": "Dr. Marie Dupont",
+    }
+
+
+def test_patient_without_gp(mediris_site):
+    client = client_for(mediris_site)
+    assert client.patient("90020199704") == {
+        "phone": "",
+        "email": "",
+        "doctor": "",
+    }
+
+
+def test_unknown_patient(mediris_site):
+    assert client_for(mediris_site).patient("00000000000") is None
+
+
+def test_loose_search_picks_the_patient_asked_for(mediris_site):
+    mediris_site.loose = True
+    client = client_for(mediris_site)
+    assert client.patient("90.02.01-997.04") == {
+        "phone": "",
+        "email": "",
+        "doctor": "",
+    }
+    assert client.patient("00000000000") is None
+
+
+def test_expired_session(mediris_site):
+    client = client_for(mediris_site, logged_in=False)
+    with pytest.raises(MedirisError, match="expired"):
+        client.waiting_room()
+
+
+def test_load_cookies_replaces_session(mediris_site):
+    client = client_for(mediris_site)
+    client.load_cookies([])
+    with pytest.raises(MedirisError):
+        client.waiting_room()
+    client.load_cookies([{"name": SESSION, "value": "1"}])
+    assert client.waiting_room()
@@ -0,0 +1,29 @@
+import pytest
+
+from validation import normalize_phone
+
+
+@pytest.mark.parametrize(
+    "phone",
+    [
+        "0470 12 34 56",
+        "0470/12.34.56",
+        "470123456",
+        "+32 470 12 34 56",
+        "+32 (0)470 12 34 56",
+        "0032 (0)470 12 34 56",
+        "0032470123456",
+        "32470123456",
+    ],
+)
+def test_belgian_mobile(phone):
+    assert normalize_phone(phone) == "+32470123456"
+
+
+def test_foreign_number():
+    assert normalize_phone("+33 6 12 34 56 78") == "+33612345678"
+
+
+def test_foreign_number_without_country_code():
+    with pytest.raises(ValueError):
+        normalize_phone("33612345678")
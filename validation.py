@@ -0,0 +1,161 @@
+# File: validation
+# Author: Theo Technicguy covrecord-program@licolas.net
+# Interpreter: Python 3.8
+# Ext: py
+# Licenced under GPU GLP v3. See LICENCE file for information.
+# Copyright (c) TheoTechnicguy 2020
+# -----------------------
+
+# Notes
+# Local validation of eID and Mediris data, before any remote round trip.
+# Checkers raise ValueError, `validate` collects their messages per field.
+# -----------------------
+import re
+
+# Precompiled patterns.
+NON_DIGITS = re.compile(r"\D")
+PHONE_SEPARATORS = re.compile(r"[\s./\-()]")
+E164 = re.compile(r"^\+[1-9]\d{6,14}$")
+EMAIL = re.compile(
+    r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+"
+    r"@[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?"
+    r"(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)*"
+    r"\.[A-Za-z]{2,}$"
+)
+
+# Default country calling code.
+COUNTRY_CODE = "32"
+# Most digits of a national phone number without its leading 0.
+NATIONAL_DIGITS = 9
+
+MALE = ("m", "male", "man")
+FEMALE = ("f", "v", "w", "female", "vrouw", "femme")
+
+
+def check_national_number(number, dateofbirth="", gender=""):
+    """Check a Belgian national number.
+
+    `dateofbirth` (YYYYMMDD) and `gender` are checked against it if given.
+    """
+    number = NON_DIGITS.sub("", str(number))
+    if len(number) != 11:
+        raise ValueError("National number must have 11 digits.")
+
+    # Checksum is 97 - (first 9 digits mod 97). Born in 2000 or later,
+    # the 9 digits are prefixed with 2.
+    body, check = int(number[:9]), int(number[9:])
+    if 97 - body % 97 == check:
+        century = "19"
+    elif 97 - (2000000000 + body) % 97 == check:
+        century = "20"
+    else:
+        raise ValueError("National number checksum is wrong.")
+
+    # BIS numbers add 20 (gender unknown) or 40 to the month.
+    month = int(number[2:4])
+    gender_known = True
+    if month >= 40:
+        month -= 40
+    elif month >= 20:
+        month -= 20
+        gender_known = False
+
+    dateofbirth = NON_DIGITS.sub("", str(dateofbirth or ""))
+    # Month 0 means the date of birth was unknown at registration.
+    if len(dateofbirth) == 8 and month:
+        expected = century + number[:2] + "%02d" % month + number[4:6]
+        if dateofbirth != expected:
+            raise ValueError("National number does not match birth date.")
+
+    gender = str(gender or "").strip().lower()
+    if gender_known and gender:
+        male = int(number[6:9]) % 2 == 1
+        if (gender in MALE and not male) or (gender in FEMALE and male):
+            raise ValueError("National number does not match gender.")
+
+    return number
+
+
+def normalize_phone(phone, country_code=COUNTRY_CODE):
+    """Normalize a phone number to E.164.
+
+    Numbers without country code or leading 0 are taken as national.
+    """
+    phone = PHONE_SEPARATORS.sub("", str(phone))
+    if phone.startswith("00"):
+        phone = "+" + phone[2:]
+    elif phone.startswith("0"):
+        phone = "+" + country_code + phone[1:]
+    elif phone.startswith("+"):
+        pass
+    elif len(phone) <= NATIONAL_DIGITS:
+        # Leading 0 forgotten, e.g. 470123456.
+        phone = "+" + country_code + phone
+    elif phone.startswith(country_code):
+        # Country code without +.
+        phone = "+" + phone
+    else:
+        raise ValueError("Phone number needs its country code.")
+
+    # Trunk 0 kept after the country code, e.g. +32 (0)470 12 34 56.
+    trunk = "+" + country_code + "0"
+    if phone.startswith(trunk):
+        phone = "+" + country_code + phone[len(trunk) :]
+
+    if not E164.match(phone):
+        raise ValueError("Phone number is not valid.")
+    return phone
+
+
+def check_email(email):
+    """Check email address syntax."""
+    email = str(email).strip()
+    if not EMAIL.match(email):
+        raise ValueError("Email address is not valid.")
+    return email
+
+
+def validate(record):
+    """Validate a record.
+
+    Return the normalized record and a {field: message} dict of errors.
+    Empty phone and email are allowed.
+    """
+    record = dict(record)
+    errors = {}
+
+    if record.get("nationalnumber"):
+        try:
+            record["nationalnumber"] = check_national_number(
+                record["nationalnumber"],
+                record.get("dateofbirth"),
+                record.get("gender"),
+            )
+        except ValueError as e:
+            errors["nationalnumber"] = str(e)
+
+    for field, check in (("phone", normalize_phone), ("email", check_email)):
+        if not record.get(field):
+            continue
+        try:
+            record[field] = check(record[field])
+        except ValueError as e:
+            errors[field] = str(e)
+
+    return record, errors
+
+
+def validate_batch(records):
+    """Validate many records at once.
+
+    Return the normalized records and a {index: errors} dict of the
+    records with errors.
+    """
+    normalized = []
+    all_errors = {}
+    for i, record in enumerate(records):
+        record, errors = validate(record)
+        normalized.append(record)
+        if errors:
+            all_errors[i] = errors
+    return normalized, all_errors